@@ -0,0 +1,11 @@
+from .generator import QueryGenerator, GeneratedQuery, find_foreign_keys, column_kind
+from .runner import (
+    STAGES,
+    run_benchmark,
+    save_results,
+    load_results,
+    compare_results,
+    print_regressions
+)
+from .data import generate_tables
+from .differential import run_differential, print_differential, load_sqlite
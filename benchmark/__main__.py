@@ -0,0 +1,152 @@
+import argparse
+import os
+import sys
+import contextlib
+import io
+
+from validator import load_metadata
+from executor import CACHE_JOINS, MORSEL_SIZE
+from cost_model import CardinalityFeedback
+from .generator import QueryGenerator, SHAPES
+from .runner import run_benchmark, save_results, load_results, compare_results, print_regressions
+from .data import generate_tables
+from .differential import run_differential, print_differential
+
+# Uso (a partir da raiz do repositório):
+#   python -m benchmark run --output atual.json
+#   python -m benchmark run --output atual.json --baseline baseline.json
+#   python -m benchmark run --stress-joins ""                (sem os casos de estresse)
+#   python -m benchmark compare baseline.json atual.json
+#   python -m benchmark diff --rows 100
+#   python -m benchmark diff --feedback cardinalidades.json   (aprende entre execuções)
+# O código de saída é 1 quando alguma regressão (ou diferença para o SQLite) é encontrada.
+
+DEFAULT_METADATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "metadados.json")
+
+
+def _int_list(text: str) -> list:
+    return [int(item) for item in text.split(',') if item.strip()]
+
+
+def _shape_list(text: str) -> list:
+    shapes = [item.strip() for item in text.split(',') if item.strip()]
+    for shape in shapes:
+        if shape not in SHAPES:
+            raise argparse.ArgumentTypeError(f"formato '{shape}' inválido (use {', '.join(SHAPES)})")
+    return shapes
+
+
+def _load_metadata(filepath: str):
+    with contextlib.redirect_stdout(io.StringIO()):
+        metadata = load_metadata(filepath)
+    if metadata is None:
+        print(f"ERRO CRÍTICO: não foi possível carregar '{filepath}'.")
+    return metadata
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Benchmark do processador de consultas")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="gera as consultas e mede cada estágio")
+    run_parser.add_argument("--metadata", default=DEFAULT_METADATA)
+    run_parser.add_argument("--output", default="bench_results.json")
+    run_parser.add_argument("--joins", type=_int_list, default=[1, 2, 4, 8],
+                            help="quantidades de JOIN separadas por vírgula (sem repetir tabela: até 9 "
+                                 "no metadados.json)")
+    run_parser.add_argument("--stress-joins", type=_int_list, default=[16, 32, 50],
+                            help="quantidades de JOIN (até 50) dos casos de estresse do parser e do "
+                                 "otimizador, com tabelas repetidas sem alias; medidos à parte")
+    run_parser.add_argument("--conjuncts", type=_int_list, default=[0, 1, 3, 6],
+                            help="quantidades de condições no WHERE separadas por vírgula")
+    run_parser.add_argument("--queries", type=int, default=2, help="consultas por combinação de tamanho")
+    run_parser.add_argument("--shapes", type=_shape_list, default=["spj"],
+                            help=f"formatos de consulta separados por vírgula ({', '.join(SHAPES)})")
+    run_parser.add_argument("--repeat", type=int, default=5, help="repetições por consulta (usa a mediana)")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--baseline", help="arquivo JSON salvo para comparar ao final")
+    run_parser.add_argument("--threshold", type=float, default=0.10)
+
+    compare_parser = subparsers.add_parser("compare", help="compara dois resultados salvos")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+
+    diff_parser = subparsers.add_parser("diff", help="compara resultados e tempos com o SQLite")
+    diff_parser.add_argument("--metadata", default=DEFAULT_METADATA)
+    diff_parser.add_argument("--joins", type=_int_list, default=[1, 2, 3, 5, 8])
+    diff_parser.add_argument("--conjuncts", type=_int_list, default=[0, 1, 2, 4])
+    diff_parser.add_argument("--queries", type=int, default=3)
+    diff_parser.add_argument("--shapes", type=_shape_list, default=list(SHAPES))
+    diff_parser.add_argument("--rows", type=int, default=100, help="linhas base por tabela nos dados sintéticos")
+    diff_parser.add_argument("--repeat", type=int, default=3)
+    diff_parser.add_argument("--seed", type=int, default=0)
+    diff_parser.add_argument("--degree", type=int, default=1, help="grau de paralelismo da execução")
+    diff_parser.add_argument("--morsel-size", type=int, default=MORSEL_SIZE)
+    diff_parser.add_argument("--pool", choices=["process", "thread"], default="process")
+    diff_parser.add_argument("--cache-mb", type=float, help="liga o cache de resultados com este limite de memória")
+    diff_parser.add_argument("--cache-joins", choices=list(CACHE_JOINS), default="final",
+                             help="junções intermediárias no cache: nenhuma, as de assinatura repetida ou todas")
+    diff_parser.add_argument("--feedback", help="arquivo JSON de cardinalidades observadas (lido e atualizado)")
+    diff_parser.add_argument("--output", help="salva o relatório em JSON")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        regressions = compare_results(load_results(args.baseline), load_results(args.current), args.threshold)
+        print_regressions(regressions)
+        return 1 if regressions else 0
+
+    if args.command == "diff":
+        metadata = _load_metadata(args.metadata)
+        if metadata is None:
+            return 2
+        queries = QueryGenerator(metadata, args.seed).generate_suite(args.joins, args.conjuncts, args.queries, args.shapes)
+        tables = generate_tables(metadata, args.rows, args.seed)
+        feedback = None
+        if args.feedback:
+            feedback = (CardinalityFeedback.load(args.feedback) if os.path.exists(args.feedback)
+                        else CardinalityFeedback())
+        report = run_differential(queries, metadata, tables, args.repeat,
+                                  args.degree, args.morsel_size, args.pool, args.cache_mb, feedback,
+                                  args.cache_joins)
+        print_differential(report)
+        if feedback is not None:
+            feedback.save(args.feedback)
+        if args.output:
+            save_results(report, args.output)
+        invalidation_errors = report["invalidation"]["errors"] if report["invalidation"] else 0
+        return 1 if report["failures"] or invalidation_errors else 0
+
+    if any(joins < 1 or joins > 50 for joins in args.stress_joins):
+        parser.error("--stress-joins deve conter valores entre 1 e 50")
+
+    metadata = _load_metadata(args.metadata)
+    if metadata is None:
+        return 2
+
+    generator = QueryGenerator(metadata, args.seed)
+    # a suíte principal só tem SQL válido: sem aliases, mais JOINs repetiriam tabelas
+    if any(joins < 1 or joins > generator.max_distinct_joins for joins in args.joins):
+        parser.error(f"--joins deve conter valores entre 1 e {generator.max_distinct_joins} "
+                     f"(acima disso as tabelas se repetem; use --stress-joins)")
+
+    queries = generator.generate_suite(args.joins, args.conjuncts, args.queries, args.shapes)
+    results = run_benchmark(queries, metadata, args.repeat, args.seed)
+    if args.stress_joins:
+        # SQL ambíguo (o SQLite rejeita): mede só parser e otimizador em árvores grandes
+        print("\nCasos de estresse do parser/otimizador (tabelas repetidas sem alias):")
+        stress = generator.generate_suite(args.stress_joins, args.conjuncts, args.queries, args.shapes)
+        results["stress_cases"] = run_benchmark(stress, metadata, args.repeat, args.seed)["cases"]
+    save_results(results, args.output)
+    print(f"\nResultados salvos em '{args.output}'.")
+
+    if args.baseline:
+        regressions = compare_results(load_results(args.baseline), results, args.threshold)
+        print_regressions(regressions)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import random
+from typing import Dict, List
+
+from cost_model import FK_PATTERN
+from .generator import WORDS, column_kind, find_foreign_keys
+
+# Dados sintéticos para o metadados.json, coerentes com as chaves estrangeiras
+# e com os tipos usados pelo gerador de consultas.
+
+# tabelas sem chave estrangeira própria (Categoria, Status...) são de domínio
+LOOKUP_ROWS = 5
+
+
+def table_sizes(metadata: Dict[str, List[str]], base_rows: int) -> Dict[str, int]:
+    # tabelas de domínio ficam pequenas; as demais crescem com o número de
+    # chaves estrangeiras para tabelas grandes (Pedido_has_Produto é a maior)
+    edges = find_foreign_keys(metadata)
+    referencing = {child for child, _, _, _ in edges}
+    sizes = {}
+    for table in metadata:
+        if table not in referencing:
+            sizes[table] = LOOKUP_ROWS
+            continue
+        big_parents = {parent for child, _, parent, _ in edges if child == table and parent in referencing}
+        sizes[table] = base_rows * (1 + len(big_parents))
+    return sizes
+
+
+def generate_tables(metadata: Dict[str, List[str]], base_rows: int = 100, seed: int = 0) -> Dict[str, list]:
+    # devolve {tabela: [tuplas]} com as colunas na ordem do metadados.json
+    rng = random.Random(f"dados:{seed}:{base_rows}")
+    sizes = table_sizes(metadata, base_rows)
+    tables = {}
+    for table in sorted(metadata):
+        columns = metadata[table]
+        rows = []
+        for row_number in range(1, sizes[table] + 1):
+            rows.append(tuple(_value(rng, table, column, row_number, metadata, sizes) for column in columns))
+        tables[table] = rows
+    return tables
+
+
+def _value(rng, table, column, row_number, metadata, sizes):
+    kind = column_kind(table, column, metadata)
+    if kind == "id":
+        match = FK_PATTERN.match(column)
+        if match and match.group(1) == match.group(2) and match.group(1) in sizes:
+            # chave estrangeira: aponta para uma linha existente da tabela pai
+            return rng.randint(1, sizes[match.group(1)])
+        # chave primária sequencial
+        return row_number
+    if kind == "int":
+        return rng.randint(0, 100)
+    if kind == "float":
+        return round(rng.uniform(1, 500), 2)
+    if kind == "date":
+        return f"{rng.randint(2015, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    return rng.choice(WORDS)
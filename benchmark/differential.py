@@ -0,0 +1,273 @@
+import contextlib
+import copy
+import io
+import math
+import sqlite3
+import time
+from collections import Counter
+from typing import Dict, List
+
+from validator import validate_sql
+from query_processor import (
+    convert_to_relational_algebra,
+    build_operator_graph,
+    optimize_graph,
+    get_attributes_from_string
+)
+from executor import QueryExecutor, MORSEL_SIZE
+from result_cache import ResultCache
+from cost_model import CardinalityFeedback, CostModel
+
+# Teste diferencial contra o SQLite: os mesmos dados sintéticos são carregados
+# num banco em memória, cada consulta roda nos dois lados e os multiconjuntos
+# de resultado são comparados. O plano NÃO otimizado também é executado, para
+# separar erro do otimizador (reescrita mudou o resultado) de erro da execução.
+# Com o cache de resultados ligado, a primeira execução de cada consulta é
+# medida à parte das repetições (que saem do cache) e, no fim, uma escrita numa
+# tabela confere a invalidação.
+
+# status possíveis de cada caso
+OK = "ok"
+OPTIMIZER_MISMATCH = "optimizer_mismatch"
+MISMATCH = "mismatch"
+ERROR = "error"
+
+# tabela escrita na conferência da invalidação do cache
+INVALIDATION_TABLE = "categoria"
+
+
+def load_sqlite(metadata: Dict[str, List[str]], tables: Dict[str, list]) -> sqlite3.Connection:
+    connection = sqlite3.connect(":memory:")
+    for table, columns in metadata.items():
+        # sem tipos declarados: o SQLite guarda cada valor com o tipo do Python
+        connection.execute(f"CREATE TABLE {table} ({', '.join(columns)})")
+        placeholders = ', '.join('?' * len(columns))
+        connection.executemany(f"INSERT INTO {table} VALUES ({placeholders})", tables.get(table, []))
+    connection.commit()
+    return connection
+
+
+def plan_query(sql: str, metadata: Dict[str, List[str]], cache: ResultCache = None, cost_model: CostModel = None):
+    # devolve (grafo não otimizado, grafo otimizado) pelo mesmo caminho do app.py
+    with contextlib.redirect_stdout(io.StringIO()):
+        if not validate_sql(sql, metadata):
+            raise ValueError(f"Consulta inválida: {sql}")
+        graph = build_operator_graph(convert_to_relational_algebra(sql))
+        optimized = copy.deepcopy(graph)
+        optimized = optimize_graph(optimized, metadata, get_attributes_from_string(optimized.value), cache,
+                                   cost_model)
+    return graph, optimized
+
+
+def as_multiset(rows) -> Counter:
+    # floats arredondados para não acusar diferença de representação
+    return Counter(tuple(round(v, 6) if isinstance(v, float) else v for v in row) for row in rows)
+
+
+def _best_of(func, repeat: int):
+    # menor tempo (ms) entre as repetições e o resultado da última
+    best = math.inf
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best, result
+
+
+def run_case(query, metadata: Dict[str, List[str]], executor: QueryExecutor,
+             connection: sqlite3.Connection, repeat: int = 3) -> dict:
+    case = {"id": query.case_id, "sql": query.sql}
+    try:
+        sqlite_ms, sqlite_rows = _best_of(lambda: connection.execute(query.sql).fetchall(), repeat)
+        plan_ms, (graph, optimized) = _best_of(lambda: plan_query(query.sql, metadata, executor.cache,
+                                                                         executor.cost_model()), 1)
+        # o plano não otimizado roda sem cache: não deixa entradas para o otimizado
+        cache, executor.cache = executor.cache, None
+        try:
+            unoptimized_ms, unoptimized = _best_of(lambda: executor.execute(graph), 1)
+        finally:
+            executor.cache = cache
+        if cache is None:
+            optimized_ms, result = _best_of(lambda: executor.execute(optimized), repeat)
+            cached_ms = None
+        else:
+            # a primeira execução calcula (ou reaproveita sub-árvores de outras
+            # consultas); as repetições leem a consulta inteira do cache
+            optimized_ms, result = _best_of(lambda: executor.execute(optimized), 1)
+            cached_ms, _ = _best_of(lambda: executor.execute(optimized), repeat)
+        bloom = executor.bloom_stats
+        replans = executor.replans
+    except Exception as e:
+        case.update({"status": ERROR, "error": f"{type(e).__name__}: {e}"})
+        return case
+
+    expected = as_multiset(sqlite_rows)
+    if as_multiset(result.rows) == expected:
+        status = OK
+    elif as_multiset(unoptimized.rows) == expected:
+        # o plano original está certo: foi uma reescrita do otimizador
+        status = OPTIMIZER_MISMATCH
+    else:
+        status = MISMATCH
+
+    case.update({
+        "status": status,
+        "rows_sqlite": len(sqlite_rows),
+        "rows_ours": len(result.rows),
+        "sqlite_ms": sqlite_ms,
+        "plan_ms": plan_ms,
+        "unoptimized_ms": unoptimized_ms,
+        "optimized_ms": optimized_ms,
+        # tempo relativo da execução otimizada em relação ao SQLite
+        "ratio": optimized_ms / sqlite_ms if sqlite_ms else math.inf,
+        # repetições com o resultado já no cache (None sem cache)
+        "cached_ms": cached_ms,
+        # {filtro: [linhas lidas, linhas descartadas]} na execução otimizada
+        "bloom": bloom,
+        # trocas de lado de construção feitas durante a execução otimizada
+        "replans": replans,
+    })
+    return case
+
+
+def _geomean(values: list):
+    values = [v for v in values if 0 < v < math.inf]
+    return math.exp(sum(map(math.log, values)) / len(values)) if values else None
+
+
+def check_invalidation(queries: list, metadata: Dict[str, List[str]], executor: QueryExecutor,
+                       connection: sqlite3.Connection, table: str = INVALIDATION_TABLE):
+    # apaga metade das linhas da tabela nos dois lados e confere que só as
+    # entradas do cache (e as cardinalidades observadas) que dependem dela
+    # saíram e que as consultas que a usam continuam batendo com o SQLite
+    if table not in metadata or (executor.cache is None and executor.feedback is None):
+        return None
+    before = executor.cache.dependencies() if executor.cache is not None else {}
+    original = executor.tables.get(table, [])
+    rows = original[::2]
+    executor.replace_rows(table, rows)
+    connection.execute(f"DELETE FROM {table}")
+    connection.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(metadata[table]))})", rows)
+    connection.commit()
+    after = executor.cache.dependencies() if executor.cache is not None else {}
+    stale_feedback = 0
+    if executor.feedback is not None:
+        stale_feedback = sum(1 for key in executor.feedback.observed if table in key.split('|', 1)[0].split(','))
+
+    dependent = {key for key, tables in before.items() if table in tables}
+    removed = before.keys() - after.keys()
+    try:
+        cases = [run_case(query, metadata, executor, connection, 1) for query in queries
+                 if query.distinct_tables and table in query.tables]
+    finally:
+        # volta os dados originais: as cardinalidades observadas com metade da
+        # tabela saem de novo e não vão para o arquivo de realimentação
+        executor.replace_rows(table, original)
+    return {
+        "table": table,
+        "entries": len(before),
+        "removed": len(removed),
+        # entradas removidas sem depender da tabela e entradas dependentes que ficaram
+        "wrongly_removed": len(removed - dependent),
+        "stale": len(dependent - removed),
+        # cardinalidades observadas com os dados antigos que sobraram
+        "stale_feedback": stale_feedback,
+        "queries": len(cases),
+        "failures": [case for case in cases if case["status"] != OK],
+        "errors": len(removed - dependent) + len(dependent - removed) + stale_feedback,
+    }
+
+
+def run_differential(queries: list, metadata: Dict[str, List[str]], tables: Dict[str, list], repeat: int = 3,
+                     degree: int = 1, morsel_size: int = MORSEL_SIZE, pool: str = "process",
+                     cache_mb: float = None, feedback: CardinalityFeedback = None,
+                     cache_joins: str = "final") -> dict:
+    connection = load_sqlite(metadata, tables)
+    # degree > 1 confere também a execução paralela contra o SQLite; com cache,
+    # as repetições e (conforme 'cache_joins') as junções comuns entre consultas vêm do cache
+    cache = ResultCache(int(cache_mb * 1024 * 1024)) if cache_mb else None
+    # com 'feedback' as cardinalidades observadas entram no planejamento das consultas seguintes.
+    # A conferência da invalidação escreve numa tabela: o executor recebe uma cópia do dicionário
+    executor = QueryExecutor(metadata, dict(tables), degree, morsel_size, pool, cache, feedback, cache_joins)
+    cases = []
+    skipped = 0
+    try:
+        for query in queries:
+            # sem aliases, tabelas repetidas são ambíguas para o SQLite
+            if not query.distinct_tables:
+                skipped += 1
+                continue
+            cases.append(run_case(query, metadata, executor, connection, repeat))
+        invalidation = check_invalidation(queries, metadata, executor, connection)
+    finally:
+        executor.close()
+        connection.close()
+
+    ok = [c for c in cases if c["status"] == OK]
+    failures = sum(1 for c in cases if c["status"] != OK)
+    if invalidation is not None:
+        failures += len(invalidation["failures"])
+    return {
+        "cases": cases,
+        "skipped": skipped,
+        "failures": failures,
+        # média geométrica do tempo relativo ao SQLite (primeira execução de cada consulta)
+        "geomean_ratio": _geomean([c["ratio"] for c in ok]),
+        # o mesmo para as repetições lidas do cache
+        "geomean_cached_ratio": _geomean([c["cached_ms"] / c["sqlite_ms"] for c in ok
+                                          if c["cached_ms"] is not None and c["sqlite_ms"]]),
+        "invalidation": invalidation,
+        "bloom_queries": sum(1 for c in cases if c.get("bloom")),
+        "bloom_removed": sum(removed for c in cases for _, removed in c.get("bloom", {}).values()),
+        "cache": cache.stats() if cache is not None else None,
+        "replans": sum(len(c.get("replans", [])) for c in cases),
+        "feedback_entries": len(feedback) if feedback is not None else None,
+    }
+
+
+def print_differential(report: dict) -> None:
+    for case in report["cases"]:
+        if case["status"] == ERROR:
+            print(f"{case['id']}: ERRO {case['error']}\n    {case['sql']}")
+            continue
+        line = (f"{case['id']}: {case['status'].upper():<18} {case['rows_ours']:>6} linhas  "
+                f"nosso {case['optimized_ms']:8.3f} ms / sqlite {case['sqlite_ms']:8.3f} ms = {case['ratio']:7.2f}x")
+        if case["cached_ms"] is not None:
+            line += f"  (cache {case['cached_ms']:.3f} ms)"
+        print(line)
+        for label, (rows_in, removed) in case["bloom"].items():
+            print(f"    Bloom {label}: {removed} de {rows_in} linhas descartadas")
+        for replan in case["replans"]:
+            print(f"    Replanejado: {replan}")
+        if case["status"] != OK:
+            print(f"    {case['sql']}\n    esperado {case['rows_sqlite']} linhas, obtido {case['rows_ours']}")
+
+    print(f"\n{len(report['cases'])} consultas comparadas, {report['skipped']} ignoradas (tabelas repetidas).")
+    if report["bloom_queries"]:
+        print(f"Filtros de Bloom descartaram {report['bloom_removed']} linhas em {report['bloom_queries']} consultas.")
+    if report["cache"] is not None:
+        cache = report["cache"]
+        print(f"Cache de resultados: {cache['hits']} acertos, {cache['misses']} faltas, "
+              f"{cache['entries']} entradas ({cache['used_bytes'] / 1024:.0f} KiB), {cache['evictions']} expulsas.")
+    invalidation = report["invalidation"]
+    if invalidation is not None:
+        print(f"Escrita em '{invalidation['table']}': {invalidation['removed']} de {invalidation['entries']} "
+              f"entradas invalidadas, {invalidation['wrongly_removed']} sem depender da tabela, "
+              f"{invalidation['stale']} dependentes mantidas, {invalidation['stale_feedback']} cardinalidades "
+              f"antigas mantidas; {invalidation['queries']} consultas refeitas.")
+        for case in invalidation["failures"]:
+            print(f"    {case['id']}: {case['status'].upper()} depois da escrita\n    {case['sql']}")
+    if report["feedback_entries"] is not None:
+        print(f"Cardinalidades observadas: {report['feedback_entries']} assinaturas, "
+              f"{report['replans']} replanejamento(s) durante a execução.")
+    if report["geomean_ratio"] is not None:
+        print(f"Tempo relativo ao SQLite (média geométrica): {report['geomean_ratio']:.2f}x")
+    if report["geomean_cached_ratio"] is not None:
+        print(f"Repetições com o resultado em cache (média geométrica): {report['geomean_cached_ratio']:.2f}x")
+    if report["failures"]:
+        print(f">>> {report['failures']} consulta(s) com resultado DIFERENTE do SQLite!")
+    else:
+        print("Todos os resultados conferem com o SQLite.")
+    if invalidation is not None and invalidation["errors"]:
+        print(f">>> A escrita em '{invalidation['table']}' não invalidou corretamente o cache/as cardinalidades!")
@@ -0,0 +1,227 @@
+import random
+from typing import Dict, List
+
+from cost_model import FK_PATTERN
+
+# Gerador sintético de consultas sobre o grafo de junções do metadados.json.
+# As junções são descobertas pelas colunas de chave estrangeira no formato
+# <Tabela>_id<Tabela> (ex: Cliente_idCliente aponta para Cliente.idCliente).
+#
+# Limitação: o metadados.json tem 10 tabelas e 9 chaves estrangeiras, e o
+# parser não aceita aliases. Com mais JOINs que QueryGenerator.max_distinct_joins
+# o gerador repete tabelas sem alias: o SQL é ambíguo (o SQLite rejeita) e o
+# otimizador não reordena essas junções. Por isso esses tamanhos (16, 32 e 50)
+# ficam fora da suíte padrão e são medidos à parte, só como estresse do parser
+# e do otimizador (GeneratedQuery.distinct_tables marca os casos afetados).
+
+# tipos de coluna inferidos pelo nome (o metadados.json não tem tipos)
+FLOAT_COLUMNS = {"preco", "valortotalpedido", "precounitario"}
+INT_COLUMNS = {"quantestoque", "quantidade", "numero", "enderecopadrao"}
+DATE_COLUMNS = {"nascimento", "dataregistro", "datapedido"}
+
+# vocabulário das colunas de texto. tudo minúsculo porque o pipeline
+# converte a consulta inteira (inclusive os literais) para minúsculas.
+WORDS = ["ana", "bruno", "carla", "diego", "elisa", "fabio", "gabi", "hugo",
+         "iris", "joao", "livros", "moveis", "roupas", "ativo", "enviado", "pago"]
+
+OPERATORS = ["=", "<>", ">", "<", ">=", "<="]
+TEXT_OPERATORS = ["=", "<>"]
+
+# formatos de consulta: seleção-projeção-junção, agregação (GROUP BY), top-N,
+# SELECT * e atributos sem o nome da tabela (quando não são ambíguos)
+SHAPES = ("spj", "aggregate", "topk", "star", "unqualified")
+
+
+def find_foreign_keys(metadata: Dict[str, List[str]]) -> list:
+    # devolve as arestas (tabela_filha, coluna_fk, tabela_pai, coluna_pk)
+    edges = []
+    for table, columns in metadata.items():
+        for column in columns:
+            match = FK_PATTERN.match(column)
+            if not match or match.group(1) != match.group(2):
+                continue
+            parent = match.group(1)
+            # só vale se a tabela pai existir e tiver a chave primária id<Tabela>
+            if parent in metadata and f"id{parent}" in metadata[parent]:
+                edges.append((table, column, parent, f"id{parent}"))
+    return edges
+
+
+def column_kind(table: str, column: str, metadata: Dict[str, List[str]]) -> str:
+    # 'id' para chaves (primárias e estrangeiras), senão o tipo pelo nome.
+    # a chave primária nem sempre é id<Tabela> (ex: Pedido_has_Produto.idPedidoProduto)
+    if column.startswith("id"):
+        return "id"
+    match = FK_PATTERN.match(column)
+    if match and match.group(1) == match.group(2) and match.group(1) in metadata:
+        return "id"
+    if column in FLOAT_COLUMNS:
+        return "float"
+    if column in INT_COLUMNS:
+        return "int"
+    if column in DATE_COLUMNS:
+        return "date"
+    return "str"
+
+
+class GeneratedQuery:
+    def __init__(self, case_id, sql, joins, conjuncts, tables):
+        self.case_id = case_id
+        self.sql = sql
+        # número de JOINs e de condições no WHERE
+        self.joins = joins
+        self.conjuncts = conjuncts
+        # tabelas na ordem em que aparecem no FROM (podem se repetir)
+        self.tables = tables
+
+    @property
+    def distinct_tables(self) -> bool:
+        # sem aliases o SQL não distingue duas ocorrências da mesma tabela
+        return len(set(self.tables)) == len(self.tables)
+
+    def __repr__(self):
+        return f"GeneratedQuery({self.case_id!r}, {self.sql!r})"
+
+
+class QueryGenerator:
+    def __init__(self, metadata: Dict[str, List[str]], seed: int = 0):
+        self.metadata = metadata
+        self.seed = seed
+        self.edges = find_foreign_keys(metadata)
+        if not self.edges:
+            raise ValueError("Nenhuma chave estrangeira encontrada nos metadados.")
+
+        # lista de adjacência: tabela -> [(tabela vizinha, condição de junção)]
+        self.adjacency = {}
+        for child, fk, parent, pk in self.edges:
+            self.adjacency.setdefault(child, []).append((parent, pk, fk))
+            self.adjacency.setdefault(parent, []).append((child, fk, pk))
+
+    @property
+    def max_distinct_joins(self) -> int:
+        # maior número de JOINs sem repetir tabela, qualquer que seja a tabela inicial
+        # (uma tabela por vez até cobrir o componente conexo do grafo de junções)
+        sizes, seen = [], set()
+        for start in sorted(self.adjacency):
+            if start in seen:
+                continue
+            component, pending = {start}, [start]
+            while pending:
+                for neighbor, _, _ in self.adjacency[pending.pop()]:
+                    if neighbor not in component:
+                        component.add(neighbor)
+                        pending.append(neighbor)
+            seen |= component
+            sizes.append(len(component))
+        return min(sizes) - 1
+
+    def generate(self, joins: int, conjuncts: int, index: int = 0, shape: str = "spj") -> GeneratedQuery:
+        if shape not in SHAPES:
+            raise ValueError(f"Formato de consulta '{shape}' inválido (use {', '.join(SHAPES)}).")
+        # semente derivada dos parâmetros: o mesmo caso gera sempre o mesmo SQL
+        rng = random.Random(f"{self.seed}:{joins}:{conjuncts}:{index}")
+
+        tables = [rng.choice(sorted(self.adjacency))]
+        join_clauses = []
+        for _ in range(joins):
+            # dict.fromkeys mantém a ordem (set dependeria do PYTHONHASHSEED)
+            known_tables = list(dict.fromkeys(tables))
+            candidates = [(known, edge) for known in known_tables
+                          for edge in self.adjacency[known] if edge[0] not in tables]
+            # o grafo tem poucas tabelas: depois de visitar todas, repete tabelas
+            # (sem alias; ver a limitação no começo do módulo)
+            if not candidates:
+                candidates = [(known, edge) for known in known_tables for edge in self.adjacency[known]]
+            known, (new_table, new_column, known_column) = rng.choice(candidates)
+            join_clauses.append(f"JOIN {new_table} ON {known}.{known_column} = {new_table}.{new_column}")
+            tables.append(new_table)
+
+        available = [(table, column) for table in dict.fromkeys(tables) for column in self.metadata[table]]
+
+        select_size = rng.randint(1, min(4, len(available)))
+        select_list = [f"{table}.{column}" for table, column in rng.sample(available, select_size)]
+
+        conditions = []
+        for _ in range(conjuncts):
+            table, column = rng.choice(available)
+            kind = column_kind(table, column, self.metadata)
+            operator = rng.choice(TEXT_OPERATORS if kind == "str" else OPERATORS)
+            conditions.append(f"{table}.{column} {operator} {random_literal(rng, kind)}")
+
+        # GROUP BY, ORDER BY e LIMIT sorteados depois, para o SQL "spj" de um
+        # caso continuar igual ao dos resultados salvos antes desses formatos
+        tail = ""
+        if shape == "star":
+            select_list = ["*"]
+        elif shape == "unqualified":
+            select_list = [self._unqualified(name, tables) for name in select_list]
+            conditions = [" ".join([self._unqualified(condition.split(" ", 1)[0], tables), condition.split(" ", 1)[1]])
+                          for condition in conditions]
+        elif shape == "aggregate":
+            select_list, tail = self._aggregate_clauses(rng, available)
+        elif shape == "topk":
+            # ordena por todas as colunas do SELECT: empates ficam idênticos e o
+            # resultado do LIMIT não depende da ordem interna de cada banco
+            order = [f"{column} {rng.choice(['ASC', 'DESC'])}" for column in select_list]
+            tail = f" ORDER BY {', '.join(order)} LIMIT {rng.randint(1, 20)}"
+
+        sql = f"SELECT {', '.join(select_list)} FROM {tables[0]}"
+        if join_clauses:
+            sql += " " + " ".join(join_clauses)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += tail
+
+        case_id = f"j{joins:02d}-w{conjuncts:02d}-q{index}"
+        if shape != "spj":
+            case_id += f"-{shape}"
+        return GeneratedQuery(case_id, sql, joins, conjuncts, tables)
+
+    def _unqualified(self, name: str, tables: list) -> str:
+        # "cliente.nome" -> "nome" quando nenhuma outra tabela da consulta tem o atributo
+        column = name.split(".")[-1]
+        owners = {table for table in tables if column in self.metadata[table]}
+        return column if len(owners) == 1 else name
+
+    def _aggregate_clauses(self, rng: random.Random, available: list):
+        # devolve (lista do SELECT, "GROUP BY ... ORDER BY ... LIMIT ...")
+        keys = [f"{table}.{column}" for table, column in
+                rng.sample(available, rng.randint(0, min(2, len(available))))]
+        numeric = [(table, column) for table, column in available
+                   if column_kind(table, column, self.metadata) in ("id", "int", "float")]
+        aggregates = []
+        for _ in range(rng.randint(1, 3)):
+            func = rng.choice(["count", "sum", "avg", "min", "max"])
+            if func == "count" or not numeric:
+                aggregates.append("COUNT(*)")
+            else:
+                table, column = rng.choice(numeric)
+                aggregates.append(f"{func.upper()}({table}.{column})")
+        select_list = keys + list(dict.fromkeys(aggregates))
+        if not keys:
+            return select_list, ""
+        # as chaves do GROUP BY identificam cada grupo, então o LIMIT é determinístico
+        tail = f" GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}"
+        if rng.random() < 0.5:
+            tail += f" LIMIT {rng.randint(1, 10)}"
+        return select_list, tail
+
+    def generate_suite(self, join_sizes, conjunct_counts, queries_per_size: int = 1, shapes=("spj",)) -> list:
+        return [self.generate(joins, conjuncts, index, shape)
+                for joins in join_sizes
+                for conjuncts in conjunct_counts
+                for index in range(queries_per_size)
+                for shape in shapes]
+
+
+def random_literal(rng: random.Random, kind: str) -> str:
+    # gera um literal SQL compatível com o tipo da coluna
+    if kind == "id":
+        return str(rng.randint(1, 20))
+    if kind == "int":
+        return str(rng.randint(0, 100))
+    if kind == "float":
+        return f"{rng.uniform(1, 500):.2f}"
+    if kind == "date":
+        return f"'{rng.randint(2015, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'"
+    return f"'{rng.choice(WORDS)}'"
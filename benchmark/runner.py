@@ -0,0 +1,181 @@
+import contextlib
+import copy
+import gc
+import io
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from validator import validate_sql
+from query_processor import (
+    convert_to_relational_algebra,
+    build_operator_graph,
+    optimize_graph,
+    generate_execution_plan,
+    get_attributes_from_string
+)
+
+# estágios medidos, na ordem do pipeline (HU1 a HU5 + renderização)
+STAGES = (
+    "validate_sql",
+    "convert_to_relational_algebra",
+    "build_operator_graph",
+    "optimize_graph",
+    "generate_execution_plan",
+    "to_mermaid",
+)
+
+
+def run_pipeline(sql: str, metadata: Dict[str, List[str]], measure) -> None:
+    # executa o pipeline completo chamando measure(estágio, função) em cada etapa.
+    # measure deve chamar a função e devolver o resultado dela.
+    # os estágios imprimem bastante no console, então a saída é descartada.
+    with contextlib.redirect_stdout(io.StringIO()):
+        if not measure("validate_sql", lambda: validate_sql(sql, metadata)):
+            raise ValueError(f"Consulta gerada é inválida: {sql}")
+        algebra = measure("convert_to_relational_algebra", lambda: convert_to_relational_algebra(sql))
+        graph = measure("build_operator_graph", lambda: build_operator_graph(algebra))
+
+        # a otimização altera a árvore, então otimiza uma cópia (igual ao app.py)
+        graph_to_optimize = copy.deepcopy(graph)
+
+        def optimize():
+            root_attributes = get_attributes_from_string(graph_to_optimize.value)
+            return optimize_graph(graph_to_optimize, metadata, root_attributes)
+
+        optimized = measure("optimize_graph", optimize)
+        measure("generate_execution_plan", lambda: generate_execution_plan(optimized))
+        measure("to_mermaid", optimized.to_mermaid)
+
+
+def time_stages(sql: str, metadata: Dict[str, List[str]], repeat: int = 5) -> Dict[str, List[float]]:
+    # tempos de cada estágio em milissegundos, uma amostra por repetição
+    samples = {stage: [] for stage in STAGES}
+
+    def measure(stage, func):
+        start = time.perf_counter()
+        result = func()
+        samples[stage].append((time.perf_counter() - start) * 1000)
+        return result
+
+    for _ in range(repeat):
+        gc.collect()
+        run_pipeline(sql, metadata, measure)
+    return samples
+
+
+def peak_memory_stages(sql: str, metadata: Dict[str, List[str]]) -> Dict[str, float]:
+    # pico de memória alocada (KiB) durante cada estágio.
+    # roda separado da medição de tempo porque o tracemalloc deixa tudo mais lento.
+    peaks = {}
+
+    def measure(stage, func):
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = func()
+        peaks[stage] = (tracemalloc.get_traced_memory()[1] - baseline) / 1024
+        return result
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run_pipeline(sql, metadata, measure)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def run_benchmark(queries: list, metadata: Dict[str, List[str]], repeat: int = 5, seed: int = 0) -> dict:
+    cases = []
+    for query in queries:
+        samples = time_stages(query.sql, metadata, repeat)
+        peaks = peak_memory_stages(query.sql, metadata)
+        stages = {
+            stage: {
+                "median_ms": statistics.median(samples[stage]),
+                "min_ms": min(samples[stage]),
+                "peak_kib": peaks[stage],
+            }
+            for stage in STAGES
+        }
+        cases.append({
+            "id": query.case_id,
+            "sql": query.sql,
+            "joins": query.joins,
+            "conjuncts": query.conjuncts,
+            # False: tabelas repetidas sem alias (SQL ambíguo, ver benchmark/generator.py)
+            "distinct_tables": query.distinct_tables,
+            "stages": stages,
+            "total_ms": sum(s["median_ms"] for s in stages.values()),
+            "peak_kib": max(s["peak_kib"] for s in stages.values()),
+        })
+        note = "" if query.distinct_tables else " (tabelas repetidas sem alias)"
+        print(f"{query.case_id}: {cases[-1]['total_ms']:.3f} ms, pico {cases[-1]['peak_kib']:.1f} KiB{note}")
+
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "cases": cases,
+    }
+
+
+def save_results(results: dict, filepath: str) -> None:
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+def load_results(filepath: str) -> dict:
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = 0.10,
+                    min_delta_ms: float = 0.05, min_delta_kib: float = 4.0) -> list:
+    # compara duas execuções caso a caso e devolve as regressões encontradas.
+    # uma métrica regride quando piora mais que 'threshold' (relativo) E mais
+    # que o piso absoluto, para não acusar ruído em estágios de microssegundos.
+    # os casos de estresse (tabelas repetidas) são comparados do mesmo jeito
+    baseline_cases = {case["id"]: case for case in baseline["cases"] + baseline.get("stress_cases", [])}
+    regressions = []
+    for case in current["cases"] + current.get("stress_cases", []):
+        old_case = baseline_cases.get(case["id"])
+        if old_case is None:
+            continue
+        if old_case["sql"] != case["sql"]:
+            print(f">>> AVISO: o caso '{case['id']}' gerou um SQL diferente do baseline (seed diferente?).")
+            continue
+        for stage, values in case["stages"].items():
+            old_values = old_case["stages"].get(stage)
+            if old_values is None:
+                continue
+            for metric, floor in (("median_ms", min_delta_ms), ("peak_kib", min_delta_kib)):
+                old, new = old_values[metric], values[metric]
+                if new - old > floor and new > old * (1 + threshold):
+                    regressions.append({
+                        "id": case["id"],
+                        "stage": stage,
+                        "metric": metric,
+                        "baseline": old,
+                        "current": new,
+                        "ratio": new / old if old else float("inf"),
+                    })
+    return regressions
+
+
+def print_regressions(regressions: list) -> None:
+    if not regressions:
+        print("\nNenhuma regressão encontrada.")
+        return
+    print(f"\n>>> {len(regressions)} REGRESSÃO(ÕES) encontrada(s):")
+    for r in regressions:
+        print(f"  {r['id']} / {r['stage']} / {r['metric']}: "
+              f"{r['baseline']:.3f} -> {r['current']:.3f} ({r['ratio']:.2f}x)")
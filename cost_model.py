@@ -0,0 +1,263 @@
+import json
+import re
+from typing import Dict, List
+
+# Modelo de Custo e Realimentação de Cardinalidades
+# Estima quantas linhas saem de cada sub-árvore para o otimizador escolher a
+# ordem das junções. As fórmulas (tamanho da tabela × seletividade) erram
+# feio com predicados correlacionados, então o executor registra quantas
+# linhas cada seleção e cada junção realmente produziram. A chave é uma
+# assinatura normalizada (tabelas + predicados, sem depender da ordem das
+# junções nem da escrita das condições) e a cardinalidade observada
+# substitui a fórmula nas próximas otimizações.
+
+# tamanho assumido quando não se sabe quantas linhas a tabela tem
+DEFAULT_TABLE_ROWS = 1000
+# seletividades padrão (System R) quando não há nada melhor
+EQUALITY_SELECTIVITY = 0.1
+RANGE_SELECTIVITY = 1 / 3
+OTHER_SELECTIVITY = 0.5
+
+# "cliente_idcliente" referencia a tabela "cliente" (também usado pelo gerador
+# de consultas e de dados do benchmark)
+FK_PATTERN = re.compile(r'^([a-z0-9_]+?)_id([a-z0-9_]+)$')
+# literais de texto (ignorados) ou atributos, qualificados ou não
+IDENTIFIER_PATTERN = re.compile(r"'[^']*'|\b([a-z_][a-z0-9_]*(?:\.[a-z_][a-z0-9_]*)?)\b")
+KEYWORDS = {'and', 'or', 'not', 'null', 'is', 'in', 'like', 'between', 'true', 'false'}
+# o que importa para dividir as conjunções: literais, parênteses e AND
+CONJUNCT_PATTERN = re.compile(r"'[^']*'|\(|\)|\s+and\s+", re.IGNORECASE)
+COMPARISON_PATTERN = re.compile(r"^([a-z_][a-z0-9_.]*)\s*(<=|>=|<>|!=|=|<|>)\s*(.+)$")
+
+
+def split_conjuncts(condition: str) -> list:
+    # divide por AND fora de parênteses e de literais de texto
+    parts, level, start = [], 0, 0
+    for match in CONJUNCT_PATTERN.finditer(condition):
+        token = match.group(0)
+        if token == '(':
+            level += 1
+        elif token == ')':
+            level -= 1
+        elif not token.startswith("'") and level == 0:
+            parts.append(condition[start:match.start()].strip())
+            start = match.end()
+    parts.append(condition[start:].strip())
+    return [part for part in parts if part]
+
+
+def condition_columns(condition: str) -> list:
+    # atributos citados na condição (sem literais, números e palavras-chave)
+    columns = []
+    for match in IDENTIFIER_PATTERN.finditer(condition.lower()):
+        name = match.group(1)
+        if name and name not in KEYWORDS and name not in columns:
+            columns.append(name)
+    return columns
+
+
+def qualify(column: str, tables, metadata: Dict[str, List[str]]):
+    # "nome" -> "cliente.nome" (None se nenhuma das tabelas tem o atributo ou se mais de uma tem)
+    if '.' in column:
+        return column
+    owners = [table for table in tables if column in metadata.get(table, [])]
+    return f"{owners[0]}.{column}" if len(owners) == 1 else None
+
+
+def signature(tables, predicates) -> str:
+    # assinatura da sub-árvore: tabelas e predicados já normalizados, ordenados
+    return f"{','.join(sorted(tables))}|{' & '.join(sorted(predicates))}"
+
+
+class CardinalityFeedback:
+    # cardinalidades observadas na execução, por assinatura
+    def __init__(self, observed: Dict[str, int] = None):
+        self.observed = dict(observed or {})
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.observed
+
+    def __len__(self) -> int:
+        return len(self.observed)
+
+    def record(self, key: str, rows: int):
+        self.observed[key] = rows
+
+    def get(self, key: str):
+        return self.observed.get(key)
+
+    def invalidate(self, table: str) -> int:
+        # esquece as cardinalidades das assinaturas que usam a tabela (escrita
+        # nela); devolve quantas saíram
+        table = table.lower()
+        keys = [key for key in self.observed if table in key.split('|', 1)[0].split(',')]
+        for key in keys:
+            del self.observed[key]
+        return len(keys)
+
+    def save(self, filepath: str):
+        # persistido para os relatórios recorrentes aprenderem entre execuções
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(self.observed, f, indent=2, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, filepath: str) -> "CardinalityFeedback":
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+
+class CostModel:
+    def __init__(self, metadata: Dict[str, List[str]], table_rows: Dict[str, int] = None,
+                 feedback: CardinalityFeedback = None):
+        self.metadata = metadata
+        self.rows = {table.lower(): count for table, count in (table_rows or {}).items()}
+        self.feedback = feedback
+
+    def table_rows(self, table: str) -> int:
+        return self.rows.get(table.lower(), DEFAULT_TABLE_ROWS)
+
+    # Assinaturas
+    def normalize(self, predicate: str, tables) -> str:
+        # minúsculas, espaços únicos, atributos qualificados e "a = b" == "b = a"
+        # (atributo ambíguo ou desconhecido fica como está)
+        text = ' '.join(predicate.lower().split())
+        text = IDENTIFIER_PATTERN.sub(
+            lambda m: (qualify(m.group(1), tables, self.metadata) or m.group(1))
+            if m.group(1) and m.group(1) not in KEYWORDS else m.group(0),
+            text)
+        match = COMPARISON_PATTERN.match(text)
+        if match and match.group(2) == '=' and re.fullmatch(r'[a-z_][a-z0-9_.]*', match.group(3)):
+            left, right = sorted((match.group(1), match.group(3)))
+            text = f"{left} = {right}"
+        return text
+
+    def normalize_all(self, predicates, tables) -> frozenset:
+        return frozenset(self.normalize(p, tables) for p in predicates)
+
+    def signature(self, tables, predicates) -> str:
+        tables = {table.lower() for table in tables}
+        return signature(tables, self.normalize_all(predicates, tables))
+
+    def describe(self, node, described: dict = None):
+        # (linhas estimadas, tabelas, predicados normalizados) da sub-árvore,
+        # numa passada só de baixo para cima. Os predicados ficam None quando há
+        # operador que não é seleção, projeção ou junção (γ, τ, Limite...):
+        # aí não existe assinatura e a fórmula não é substituída.
+        # Com 'described', guarda também a descrição de cada nó da sub-árvore
+        result = self._describe(node, described)
+        if described is not None:
+            described[node] = result
+        return result
+
+    def _describe(self, node, described):
+        kind = node.node_type
+        if kind == 'Tabela':
+            table = node.value.strip().lower()
+            return self.table_rows(table), {table}, frozenset()
+        children = [self.describe(c, described) for c in node.children]
+        rows, tables, predicates = children[0]
+        if kind in ('π', 'Bloom', 'Cache'):
+            return children[0]
+        if kind == 'σ':
+            conjuncts = split_conjuncts(node.value)
+            rows *= self.selectivity(conjuncts, tables)
+            if predicates is not None:
+                predicates = predicates | self.normalize_all(conjuncts, tables)
+        elif kind == '⨝':
+            right_rows, right_tables, right_predicates = children[1]
+            conjuncts = split_conjuncts(node.value)
+            rows = self.join_rows(tables, rows, right_tables, right_rows, conjuncts)
+            tables = tables | right_tables
+            if predicates is not None and right_predicates is not None:
+                predicates = predicates | right_predicates | self.normalize_all(conjuncts, tables)
+            else:
+                predicates = None
+        elif kind in ('Limite', 'Top-K'):
+            rows = min(float(node.value.split(';')[0]), rows)
+            predicates = None
+        else:
+            # τ não muda a contagem; γ tem no máximo uma linha por linha de entrada
+            predicates = None
+
+        if predicates is not None and self.feedback:
+            observed = self.feedback.get(signature(tables, predicates))
+            if observed is not None:
+                rows = observed
+        return rows, tables, predicates
+
+    def node_signature(self, node):
+        _, tables, predicates = self.describe(node)
+        return signature(tables, predicates) if predicates is not None else None
+
+    # Estimativas
+    def estimate(self, node) -> float:
+        return self.describe(node)[0]
+
+    def _referenced_table(self, column: str):
+        # tabela cuja chave primária o atributo representa (PK ou FK pelo nome)
+        if '.' not in column:
+            return None
+        table, name = column.split('.', 1)
+        if name == f"id{table}":
+            return table
+        match = FK_PATTERN.match(name)
+        if match and match.group(1) in self.metadata:
+            return match.group(1)
+        return None
+
+    def _distinct(self, column: str, rows: float) -> float:
+        # valores distintos: limitado pelo tamanho da tabela referenciada
+        referenced = self._referenced_table(column)
+        if referenced is None:
+            return max(rows, 1.0)
+        return max(min(rows, self.table_rows(referenced)), 1.0)
+
+    def selectivity(self, predicates, tables) -> float:
+        result = 1.0
+        for predicate in predicates:
+            match = COMPARISON_PATTERN.match(self.normalize(predicate, tables))
+            if match is None:
+                result *= OTHER_SELECTIVITY
+                continue
+            column, comparator, _ = match.groups()
+            if comparator == '=':
+                referenced = self._referenced_table(column)
+                result *= 1 / self.table_rows(referenced) if referenced else EQUALITY_SELECTIVITY
+            elif comparator in ('<>', '!='):
+                result *= 1 - EQUALITY_SELECTIVITY
+            else:
+                result *= RANGE_SELECTIVITY
+        return result
+
+    def join_rows(self, left_tables, left_rows: float, right_tables, right_rows: float, predicates) -> float:
+        # |L|·|R| / max(V(L, a), V(R, b)) para a igualdade; as demais
+        # condições entram como seleção sobre o resultado
+        tables = set(left_tables) | set(right_tables)
+        rows = left_rows * right_rows
+        equality_used = False
+        others = []
+        for predicate in predicates:
+            match = COMPARISON_PATTERN.match(self.normalize(predicate, tables))
+            if (not equality_used and match and match.group(2) == '='
+                    and re.fullmatch(r'[a-z_][a-z0-9_.]*', match.group(3))):
+                a, b = match.group(1), match.group(3)
+                if a.split('.')[0] in right_tables:
+                    a, b = b, a
+                rows /= max(self._distinct(a, left_rows), self._distinct(b, right_rows))
+                equality_used = True
+            else:
+                others.append(predicate)
+        return rows * self.selectivity(others, tables)
+
+    def estimate_join(self, left, right, predicates) -> float:
+        # left/right: (tabelas, predicados normalizados, linhas) de cada lado já
+        # estimado; normalizados uma vez só, já que o otimizador guloso testa
+        # muitas combinações
+        left_tables, left_predicates, left_rows = left
+        right_tables, right_predicates, right_rows = right
+        if self.feedback and left_predicates is not None and right_predicates is not None:
+            tables = set(left_tables) | set(right_tables)
+            key = signature(tables, left_predicates | right_predicates | self.normalize_all(predicates, tables))
+            observed = self.feedback.get(key)
+            if observed is not None:
+                return observed
+        return self.join_rows(left_tables, left_rows, right_tables, right_rows, predicates)
@@ -0,0 +1,1142 @@
+import functools
+import heapq
+import math
+import multiprocessing
+import operator
+import pickle
+import re
+import threading
+import weakref
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List
+
+from query_processor import (Node, cache_key, describe_step, fingerprint, get_tables, parse_aggregate_value,
+                             parse_bloom_value, split_top_level)
+from result_cache import ResultCache
+from cost_model import CardinalityFeedback, CostModel, split_conjuncts
+
+# Execução do Plano
+# Executa a árvore de operadores (π, σ, ⨝, Tabela) sobre tabelas em memória.
+# As tabelas são um dicionário {nome_da_tabela: [tuplas]}, com as colunas na
+# mesma ordem do metadados.json. As colunas intermediárias são qualificadas
+# ("cliente.nome") para não confundir atributos com o mesmo nome.
+
+COMPARATORS = {
+    '=': operator.eq,
+    '<>': operator.ne,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '<': operator.lt,
+    '>=': operator.ge,
+    '<=': operator.le,
+}
+
+# literais de texto, operadores, parênteses, números e atributos
+TOKEN_PATTERN = re.compile(r"\s*('[^']*'|<=|>=|<>|!=|=|<|>|\(|\)|[0-9]+(?:\.[0-9]+)?|[a-z_][a-z0-9_.]*)", re.IGNORECASE)
+
+
+class Relation:
+    def __init__(self, columns: List[str], rows: list):
+        # nomes qualificados das colunas ("tabela.coluna")
+        self.columns = list(columns)
+        # lista de tuplas, na ordem de 'columns'
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return f"Relation({self.columns}, {len(self.rows)} linhas)"
+
+
+def resolve_columns(name: str, columns: List[str]) -> List[int]:
+    # atributo qualificado só casa com ele mesmo; sem tabela, casa com
+    # todas as colunas que terminam com o nome (mesma regra das projeções
+    # intermediárias do otimizador, que usam nomes sem tabela)
+    name = name.lower()
+    if '.' in name:
+        return [i for i, column in enumerate(columns) if column == name]
+    return [i for i, column in enumerate(columns) if column.split('.')[-1] == name]
+
+
+def resolve_column(name: str, columns: List[str]) -> int:
+    indexes = resolve_columns(name, columns)
+    if not indexes:
+        raise ValueError(f"Atributo '{name}' não existe na entrada do operador: {columns}")
+    return indexes[0]
+
+
+def _tokenize(text: str) -> list:
+    tokens = []
+    text = text.strip()
+    pos = 0
+    while pos < len(text):
+        match = TOKEN_PATTERN.match(text, pos)
+        if not match:
+            raise ValueError(f"Símbolo inesperado na condição: '{text[pos:]}'")
+        tokens.append(match.group(1))
+        pos = match.end()
+    return tokens
+
+
+def _parse_literal(token: str):
+    if token.startswith("'"):
+        return token[1:-1]
+    if '.' in token:
+        return float(token)
+    return int(token)
+
+
+def _is_identifier(token: str) -> bool:
+    return token[0].isalpha() or token[0] == '_'
+
+
+class _ConditionCompiler:
+    # descida recursiva: or -> and -> comparação | (expressão)
+    def __init__(self, tokens: list, columns: List[str]):
+        self.tokens = tokens
+        self.columns = columns
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos].lower() if self.pos < len(self.tokens) else None
+
+    def advance(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def compile(self):
+        predicate = self._or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Condição mal formada perto de '{self.tokens[self.pos]}'")
+        return predicate
+
+    def _or(self):
+        left = self._and()
+        while self.peek() == 'or':
+            self.advance()
+            right = self._and()
+            left = (lambda l, r: lambda row: l(row) or r(row))(left, right)
+        return left
+
+    def _and(self):
+        left = self._comparison()
+        while self.peek() == 'and':
+            self.advance()
+            right = self._comparison()
+            left = (lambda l, r: lambda row: l(row) and r(row))(left, right)
+        return left
+
+    def _comparison(self):
+        if self.peek() == '(':
+            self.advance()
+            inner = self._or()
+            if self.peek() != ')':
+                raise ValueError("Parêntese não fechado na condição.")
+            self.advance()
+            return inner
+
+        left_index, left_value = self._operand()
+        op = self.peek()
+        if op not in COMPARATORS:
+            raise ValueError(f"Operador '{op}' não suportado na execução.")
+        self.advance()
+        right_index, right_value = self._operand()
+        compare = COMPARATORS[op]
+
+        # casos mais comuns (coluna x literal, coluna x coluna) sem indireção extra
+        if left_index is not None and right_index is None:
+            return lambda row: compare(row[left_index], right_value)
+        if left_index is not None and right_index is not None:
+            return lambda row: compare(row[left_index], row[right_index])
+        if left_index is None and right_index is not None:
+            return lambda row: compare(left_value, row[right_index])
+        result = compare(left_value, right_value)
+        return lambda row: result
+
+    def _operand(self):
+        # devolve (índice da coluna, None) ou (None, valor literal)
+        if self.pos >= len(self.tokens):
+            raise ValueError("Condição terminou antes do esperado.")
+        token = self.advance()
+        if _is_identifier(token) and not token.startswith("'"):
+            return resolve_column(token, self.columns), None
+        return None, _parse_literal(token)
+
+
+def compile_condition(condition: str, columns: List[str]):
+    # converte o texto da condição em uma função row -> bool
+    return _ConditionCompiler(_tokenize(condition), columns).compile()
+
+
+def equi_join_keys(condition: str, left_columns: List[str], right_columns: List[str]):
+    # se a condição for "a = b" com um lado em cada filho, devolve os
+    # índices (esquerda, direita) para usar hash join; senão None
+    tokens = _tokenize(condition)
+    if len(tokens) != 3 or tokens[1] != '=' or not all(_is_identifier(t) for t in (tokens[0], tokens[2])):
+        return None
+    for a, b in ((tokens[0], tokens[2]), (tokens[2], tokens[0])):
+        left_indexes = resolve_columns(a, left_columns)
+        right_indexes = resolve_columns(b, right_columns)
+        if left_indexes and right_indexes:
+            return left_indexes[0], right_indexes[0]
+    return None
+
+
+def projection_indexes(attributes: str, columns: List[str]) -> List[int]:
+    # índices mantidos por um π, na ordem da lista de atributos
+    indexes = []
+    for attr in (a.strip() for a in attributes.split(',')):
+        if attr == '*':
+            matched = list(range(len(columns)))
+        else:
+            matched = resolve_columns(attr, columns)
+            if not matched:
+                raise ValueError(f"Atributo '{attr}' não existe na entrada da projeção: {columns}")
+        for index in matched:
+            if index not in indexes:
+                indexes.append(index)
+    return indexes
+
+
+# Agregação (γ), ordenação (τ), Limite e Top-K
+
+def compile_aggregation(value: str, columns: List[str]):
+    # valor "chaves; agregações", onde cada agregação pode ter um nome com "as"
+    # (o γ final de uma agregação parcial usa "sum(count(*)) as count(*)").
+    # devolve (índices das chaves, [(função, índices dos argumentos)], colunas de saída)
+    group_keys, aggregates = parse_aggregate_value(value)
+    key_indexes = [resolve_column(key, columns) for key in group_keys]
+    specs, names = [], []
+    for item in aggregates:
+        expression, name = item, item
+        if ' as ' in item:
+            expression, name = (part.strip() for part in item.rsplit(' as ', 1))
+        match = re.match(r'^(count|sum|avg|min|max)\((.*)\)$', expression)
+        if not match:
+            raise ValueError(f"Agregação '{item}' não suportada na execução.")
+        args = split_top_level(match.group(2))
+        specs.append((match.group(1), [None if arg == '*' else resolve_column(arg, columns) for arg in args]))
+        names.append(name)
+    return key_indexes, specs, [columns[i] for i in key_indexes] + names
+
+
+def _aggregate(func: str, indexes: list, rows: list):
+    if indexes == [None]:
+        # count(*)
+        return len(rows)
+    values = [row[indexes[0]] for row in rows if row[indexes[0]] is not None]
+    if func == 'count':
+        return len(values)
+    if not values:
+        return None
+    if func == 'sum':
+        return sum(values)
+    if func == 'min':
+        return min(values)
+    if func == 'max':
+        return max(values)
+    if len(indexes) == 2:
+        # avg(somas, contagens): combina médias parciais
+        total = sum(row[indexes[1]] for row in rows if row[indexes[1]] is not None)
+        return sum(values) / total if total else None
+    return sum(values) / len(values)
+
+
+def aggregate_rows(rows: list, key_indexes: List[int], specs: list) -> list:
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[i] for i in key_indexes), []).append(row)
+    # sem GROUP BY sempre sai uma linha, mesmo sem entrada (count(*) = 0)
+    if not key_indexes and not groups:
+        groups[()] = []
+    return [key + tuple(_aggregate(func, indexes, group) for func, indexes in specs)
+            for key, group in groups.items()]
+
+
+def parse_order(value: str, columns: List[str]) -> list:
+    # "a desc, b" -> [(índice de a, True), (índice de b, False)]
+    order = []
+    for item in split_top_level(value):
+        descending = False
+        parts = item.rsplit(' ', 1)
+        if len(parts) == 2 and parts[1] in ('asc', 'desc'):
+            item, descending = parts[0], parts[1] == 'desc'
+        order.append((resolve_column(item, columns), descending))
+    return order
+
+
+def sort_rows(rows: list, order: list) -> list:
+    # ordenação estável, da última chave para a primeira
+    rows = list(rows)
+    for index, descending in reversed(order):
+        rows.sort(key=operator.itemgetter(index), reverse=descending)
+    return rows
+
+
+def top_k(rows: list, k: int, order: list) -> list:
+    # heap limitado a k linhas em vez de ordenar a entrada toda
+    def compare(a, b):
+        for index, descending in order:
+            x, y = a[index], b[index]
+            if x != y:
+                result = -1 if x < y else 1
+                return -result if descending else result
+        return 0
+    return heapq.nsmallest(k, rows, key=functools.cmp_to_key(compare))
+
+
+# Filtro de Bloom (redutor de semi-junção)
+# Conjunto aproximado das chaves do lado de construção de uma junção. Não há
+# falso negativo: a linha descartada pelo filtro não teria par na tabela hash,
+# então cortá-la cedo só poupa trabalho das junções e operadores de cima.
+
+# até este número de chaves o filtro é o próprio conjunto de chaves (exato)
+EXACT_FILTER_MAX_KEYS = 10000
+
+
+def _stable_hash(key) -> int:
+    # hash de 64 bits determinístico (o hash() de str muda entre processos)
+    if isinstance(key, float) and key.is_integer():
+        key = int(key)
+    if isinstance(key, int):
+        # multiplicação de Fibonacci: espalha chaves sequenciais pelos bits altos
+        return (key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    data = repr(key).encode('utf-8')
+    return (zlib.crc32(data) << 32) | zlib.crc32(data, 0x5BD1E995)
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.05):
+        capacity = max(capacity, 1)
+        # m = -n·ln(p) / ln(2)² bits e k = -log2(p) funções de hash
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(-math.log2(error_rate)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # hash duplo: h1 + i·h2 simula k funções independentes
+        value = _stable_hash(key)
+        first, second, size = value >> 32, (value & 0xFFFFFFFF) | 1, self.size
+        return [(first + i * second) % size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key) -> bool:
+        bits = self.bits
+        for position in self._positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+def bloom_from_table(hash_table: dict):
+    # filtro com as chaves da tabela hash já montada. Em Python puro testar um
+    # frozenset é mais barato que calcular as k posições do Bloom, então o
+    # Bloom só compensa quando o conjunto de chaves ficaria grande demais para
+    # enviar aos workers
+    if len(hash_table) <= EXACT_FILTER_MAX_KEYS:
+        return frozenset(hash_table)
+    bloom = BloomFilter(len(hash_table))
+    for key in hash_table:
+        bloom.add(key)
+    return bloom
+
+
+def bloom_sources(node: Node) -> set:
+    # chaves de construção usadas pelos nós Bloom da sub-árvore
+    # (não entra em nós Cache: o resultado guardado não usa filtro)
+    sources = {parse_bloom_value(node.value)[1]} if node.node_type == 'Bloom' else set()
+    if node.node_type == 'Cache':
+        return sources
+    for child in node.children:
+        sources |= bloom_sources(child)
+    return sources
+
+
+def record_bloom_stats(total: dict, stats: dict):
+    # soma as contagens {filtro: [linhas lidas, linhas descartadas]}
+    for label, (rows_in, removed) in stats.items():
+        entry = total.setdefault(label, [0, 0])
+        entry[0] += rows_in
+        entry[1] += removed
+
+
+# o que o cache de resultados guarda: só o resultado final, também as junções
+# cuja assinatura já apareceu antes, ou toda junção
+CACHE_JOINS = ("final", "repeated", "all")
+
+# Execução paralela
+# Varreduras grandes são divididas em morsels (faixas de linhas) processados
+# por um pool de workers, que aplicam σ/π e, quando a varredura alimenta uma
+# junção, também a sondagem (probe) da tabela hash. Quando o lado de
+# construção é uma varredura paralela, cada worker divide as linhas do seu
+# morsel pela partição da chave; a tabela hash de cada partição junta as linhas
+# dela e cada sondagem vai só à partição da chave. Os workers recebem só as
+# tabelas que varrem, uma vez por versão da tabela, e o que depende da consulta
+# (passos, tabela hash, filtros de Bloom) é serializado uma vez só em memória
+# compartilhada: cada tarefa leva apenas a faixa [início, fim). As duas
+# subárvores de uma junção "bushy" rodam ao mesmo tempo. Por causa do GIL, o
+# pool padrão é de processos; "thread" só escala em Python sem GIL.
+
+MORSEL_SIZE = 10000
+# dados de tarefas paralelas guardados por worker (as tabelas hash mais recentes)
+SHARED_PAYLOADS_PER_WORKER = 4
+
+# replanejamento: resultado intermediário REPLAN_FACTOR vezes maior que o
+# estimado (e com pelo menos REPLAN_MIN_ROWS linhas) troca o lado de construção
+REPLAN_FACTOR = 4
+REPLAN_MIN_ROWS = 1000
+
+# estado de cada processo worker (zerado pelo initializer do pool)
+_worker_state = {"compiled": {}, "shared": {}, "tables": {}}
+
+
+def _init_worker():
+    _worker_state["compiled"] = {}
+    _worker_state["shared"] = {}
+    # tabela -> (bloco compartilhado de onde veio, linhas)
+    _worker_state["tables"] = {}
+
+
+class SharedPayload:
+    # dados de uma tarefa paralela (ou as linhas de uma tabela) serializados
+    # uma vez em memória compartilhada. Só o nome do bloco vai em cada tarefa;
+    # cada worker lê o bloco na primeira tarefa e guarda o resultado em _worker_state
+    def __init__(self, payload):
+        data = pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)
+        self._memory = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        self._memory.buf[:len(data)] = data
+        self.name = self._memory.name
+        self.size = len(data)
+
+    def __getstate__(self):
+        return {"name": self.name, "size": self.size}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._memory = None
+
+    def read(self):
+        memory = shared_memory.SharedMemory(name=self.name)
+        try:
+            return pickle.loads(memory.buf[:self.size])
+        finally:
+            memory.close()
+
+    def load(self):
+        shared = _worker_state["shared"]
+        payload = shared.get(self.name)
+        if payload is None:
+            payload = self.read()
+            if len(shared) >= SHARED_PAYLOADS_PER_WORKER:
+                # dicionários mantêm a ordem de inserção: sai o mais antigo
+                del shared[next(iter(shared))]
+            shared[self.name] = payload
+        return payload
+
+    def release(self):
+        # chamado pelo coordenador depois que todas as tarefas terminaram
+        if self._memory is not None:
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
+
+
+def scan_pipeline(node: Node):
+    # se o nó for uma cadeia de σ/π/Bloom terminando em uma Tabela, devolve
+    # (tabela, [(tipo, valor), ...]) com os passos de baixo para cima
+    steps = []
+    while node.node_type in ('σ', 'π', 'Bloom'):
+        steps.append((node.node_type, node.value))
+        node = node.children[0]
+    if node.node_type != 'Tabela':
+        return None
+    return node.value.strip().lower(), steps[::-1]
+
+
+def compile_steps(columns: List[str], steps: list):
+    # compila os passos σ/π/Bloom e devolve (operações, colunas de saída)
+    ops = []
+    for kind, value in steps:
+        if kind == 'σ':
+            ops.append((kind, compile_condition(value, columns)))
+        elif kind == 'Bloom':
+            column, source = parse_bloom_value(value)
+            ops.append((kind, (resolve_column(column, columns), source, value)))
+        else:
+            indexes = projection_indexes(value, columns)
+            ops.append((kind, (operator.itemgetter(*indexes), len(indexes) == 1)))
+            columns = [columns[i] for i in indexes]
+    return ops, columns
+
+
+def apply_steps(rows: list, ops: list, filters: dict = None, stats: dict = None) -> list:
+    for kind, op in ops:
+        if kind == 'σ':
+            rows = [row for row in rows if op(row)]
+        elif kind == 'Bloom':
+            index, source, label = op
+            bloom = filters.get(source) if filters else None
+            if bloom is None:
+                # filtro ainda não construído (ex.: plano executado fora de ordem): não filtra
+                continue
+            before = len(rows)
+            rows = [row for row in rows if row[index] in bloom]
+            if stats is not None:
+                record_bloom_stats(stats, {label: [before, before - len(rows)]})
+        else:
+            getter, single = op
+            rows = [(getter(row),) for row in rows] if single else [getter(row) for row in rows]
+    return rows
+
+
+def build_hash_table(rows: list, key_index: int) -> dict:
+    # tabela hash do lado de construção: chave -> linhas
+    hash_table = {}
+    for row in rows:
+        hash_table.setdefault(row[key_index], []).append(row)
+    return hash_table
+
+
+def probe_rows(rows: list, key_index: int, hash_table: dict, build_first: bool = False) -> list:
+    # build_first: a tabela hash veio do lado esquerdo (lado de construção trocado
+    # em tempo de execução), então as colunas dela vêm primeiro
+    if isinstance(hash_table, PartitionedHashTable):
+        # sem build_first: a troca de lado só acontece com os dois lados materializados
+        partitions = hash_table.partitions
+        count = len(partitions)
+        return [l + r for l in rows for key in (l[key_index],)
+                for r in partitions[_partition_of(key, count)].get(key, ())]
+    if build_first:
+        return [b + r for r in rows for b in hash_table.get(r[key_index], ())]
+    return [l + r for l in rows for r in hash_table.get(l[key_index], ())]
+
+
+def _partition_of(key, partitions: int) -> int:
+    # partição da chave, a mesma em todos os processos (o hash de str muda de
+    # um processo para outro; o de números não)
+    if isinstance(key, str):
+        return zlib.crc32(key.encode('utf-8')) % partitions
+    if key is None:
+        return 0
+    return hash(key) % partitions
+
+
+class PartitionedHashTable:
+    # tabela hash do lado de construção dividida pela partição da chave: cada
+    # partição é montada só com as linhas dela e a sondagem vai à partição da chave
+    def __init__(self, partitions: list):
+        self.partitions = partitions
+
+    def get(self, key, default=None):
+        return self.partitions[_partition_of(key, len(self.partitions))].get(key, default)
+
+    def __len__(self) -> int:
+        return sum(len(partition) for partition in self.partitions)
+
+    def __iter__(self):
+        for partition in self.partitions:
+            yield from partition
+
+
+def _table_rows(table: str, rows):
+    # linhas da tabela: direto (pool de threads) ou do bloco compartilhado,
+    # lido uma vez por worker (cada escrita na tabela gera um bloco novo)
+    if not isinstance(rows, SharedPayload):
+        return rows
+    loaded = _worker_state["tables"].get(table)
+    if loaded is None or loaded[0] != rows.name:
+        loaded = _worker_state["tables"][table] = (rows.name, rows.read())
+    return loaded[1]
+
+
+def _compiled_steps(columns: List[str], steps: list) -> list:
+    compiled = _worker_state["compiled"]
+    cache_key = (tuple(columns), tuple(steps))
+    ops = compiled.get(cache_key)
+    if ops is None:
+        if len(compiled) > 256:
+            compiled.clear()
+        ops = compiled[cache_key] = compile_steps(columns, steps)[0]
+    return ops
+
+
+def _pipeline_morsel(payload, rows, start, end):
+    # tarefa de um worker: σ/π/Bloom (e o probe, se houver) sobre uma faixa de linhas.
+    # payload: (tabela, colunas, passos, probe, filtros), compartilhado pelos morsels
+    if isinstance(payload, SharedPayload):
+        payload = payload.load()
+    table, columns, steps, probe, filters = payload
+    stats = {}
+    rows = apply_steps(_table_rows(table, rows)[start:end], _compiled_steps(columns, steps), filters, stats)
+    scanned = len(rows)
+    if probe is not None:
+        rows = probe_rows(rows, *probe)
+    return rows, stats, scanned
+
+
+def _build_morsel(payload, rows, start, end):
+    # tarefa de construção: σ/π/Bloom sobre uma faixa de linhas, que sai
+    # dividida pela partição da chave. payload: (tabela, colunas, passos,
+    # chave, partições, filtros), compartilhado pelos morsels
+    if isinstance(payload, SharedPayload):
+        payload = payload.load()
+    table, columns, steps, key_index, partitions, filters = payload
+    stats = {}
+    rows = apply_steps(_table_rows(table, rows)[start:end], _compiled_steps(columns, steps), filters, stats)
+    parts = [[] for _ in range(partitions)]
+    for row in rows:
+        parts[_partition_of(row[key_index], partitions)].append(row)
+    return parts, stats, len(rows)
+
+
+def _used_filters(steps: list, filters: dict) -> dict:
+    # só os filtros de Bloom usados pelos passos (o que vai para os workers)
+    return {source: filters[source] for kind, value in steps if kind == 'Bloom'
+            for source in [parse_bloom_value(value)[1]] if source in filters}
+
+
+def _contains_join(node: Node) -> bool:
+    return node.node_type == '⨝' or any(_contains_join(c) for c in node.children)
+
+
+def _planned_rows(node: Node):
+    # estimativa feita pelo otimizador (π, Bloom e Cache não mudam a contagem)
+    while node.estimated_rows is None and node.node_type in ('π', 'Bloom', 'Cache'):
+        node = node.children[0]
+    return node.estimated_rows
+
+
+def _without_projections(node: Node) -> Node:
+    # cópia da sub-árvore sem os π (o próprio nó, se não houver nenhum)
+    if node.node_type == 'π':
+        return _without_projections(node.children[0])
+    children = [_without_projections(c) for c in node.children]
+    if all(new is old for new, old in zip(children, node.children)):
+        return node
+    copy = Node(node.node_type, node.value, children)
+    copy.estimated_rows = node.estimated_rows
+    return copy
+
+
+class QueryExecutor:
+    def __init__(self, metadata: Dict[str, List[str]], tables: Dict[str, list],
+                 degree: int = 1, morsel_size: int = MORSEL_SIZE, pool: str = "process",
+                 cache: ResultCache = None, feedback: CardinalityFeedback = None, cache_joins: str = "final"):
+        if degree < 1:
+            raise ValueError("O grau de paralelismo deve ser pelo menos 1.")
+        if pool not in ("process", "thread"):
+            raise ValueError(f"Tipo de pool '{pool}' inválido (use 'process' ou 'thread').")
+        if cache_joins not in CACHE_JOINS:
+            raise ValueError(f"Política de cache '{cache_joins}' inválida (use {', '.join(CACHE_JOINS)}).")
+        self.metadata = metadata
+        self.tables = tables
+        # número de workers; 1 executa tudo no processo atual
+        self.degree = degree
+        self.morsel_size = morsel_size
+        self.pool = pool
+        self._workers = None
+        # tabela -> bloco compartilhado com as linhas lidas pelos workers
+        self._shared_tables = {}
+        # as subárvores de uma junção "bushy" rodam em duas threads
+        self._pool_lock = threading.Lock()
+        # linhas lidas e descartadas por filtro de Bloom na última execução
+        self.bloom_stats = {}
+        self._stats_lock = threading.Lock()
+        # resultados materializados (consulta inteira e junções); None desliga
+        self.cache = cache
+        # junções intermediárias guardam todas as colunas (sem as projeções
+        # intermediárias), então só são materializadas quando pedido: "final"
+        # guarda só a consulta inteira, "repeated" também a junção cuja
+        # assinatura já apareceu em outra execução e "all" toda junção.
+        # Entradas já presentes são reaproveitadas em qualquer caso
+        self.cache_joins = cache_joins
+        self._seen_joins = set()
+        # cardinalidades observadas para o modelo de custo; com ela ligada a
+        # execução também troca o lado de construção de uma junção quando o
+        # resultado real fica muito maior que o estimado
+        self.feedback = feedback
+        self.replans = []
+        # assinatura de cada nó já visto (o mesmo plano roda várias vezes)
+        self._signatures = weakref.WeakKeyDictionary()
+        self._scan_signatures = {}
+        # chaves no cache de cada nó e a sub-árvore sem π que é materializada
+        self._cache_keys = weakref.WeakKeyDictionary()
+        self._full_sources = weakref.WeakKeyDictionary()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._pool_lock:
+            if self._workers is not None:
+                self._workers.shutdown()
+                self._workers = None
+            for shared in self._shared_tables.values():
+                shared.release()
+            self._shared_tables = {}
+
+    def _pool(self):
+        # o pool é criado na primeira tarefa paralela e reaproveitado até o close()
+        with self._pool_lock:
+            if self._workers is None:
+                if self.pool == "process":
+                    # forkserver: os workers não herdam travas seguradas por
+                    # outras threads do coordenador (junções "bushy")
+                    self._workers = ProcessPoolExecutor(max_workers=self.degree,
+                                                        mp_context=multiprocessing.get_context("forkserver"),
+                                                        initializer=_init_worker)
+                else:
+                    self._workers = ThreadPoolExecutor(max_workers=self.degree)
+            return self._workers
+
+    def _shared_table(self, table: str) -> SharedPayload:
+        # linhas da tabela para os workers: o bloco é criado na primeira
+        # varredura paralela da tabela e refeito só depois de uma escrita nela
+        with self._pool_lock:
+            shared = self._shared_tables.get(table)
+            if shared is None:
+                shared = self._shared_tables[table] = SharedPayload(self.tables[table])
+            return shared
+
+    def _map_morsels(self, task, payload, table: str, ranges: list) -> list:
+        # roda a tarefa em cada morsel e devolve os resultados na ordem dos
+        # morsels. Com pool de threads os workers leem tudo direto deste
+        # processo; com processos o que depende da consulta vai uma vez, em
+        # memória compartilhada
+        if self.pool == "thread":
+            rows = self.tables[table]
+        else:
+            payload, rows = SharedPayload(payload), self._shared_table(table)
+        try:
+            pool = self._pool()
+            futures = [pool.submit(task, payload, rows, start, end) for start, end in ranges]
+            return [future.result() for future in futures]
+        finally:
+            if isinstance(payload, SharedPayload):
+                payload.release()
+
+    # Escritas
+    # toda escrita passa por aqui: invalida só as entradas do cache e as
+    # cardinalidades observadas que dependem da tabela e descarta o bloco
+    # compartilhado dela (os workers leem o novo na próxima varredura paralela)
+    def insert_rows(self, table: str, rows: list):
+        table = table.lower()
+        self.tables[table] = self.tables.get(table, []) + [tuple(row) for row in rows]
+        self._table_changed(table)
+
+    def replace_rows(self, table: str, rows: list):
+        table = table.lower()
+        self.tables[table] = [tuple(row) for row in rows]
+        self._table_changed(table)
+
+    def _table_changed(self, table: str):
+        if self.cache is not None:
+            self.cache.invalidate(table)
+        if self.feedback is not None:
+            # as cardinalidades observadas com os dados antigos não valem mais
+            self.feedback.invalidate(table)
+        with self._pool_lock:
+            shared = self._shared_tables.pop(table, None)
+        if shared is not None:
+            shared.release()
+
+    def cost_model(self) -> CostModel:
+        # estimativas com o tamanho atual das tabelas e o que já foi observado
+        return CostModel(self.metadata, {table: len(rows) for table, rows in self.tables.items()}, self.feedback)
+
+    def _observe(self, node: Node, rows: int):
+        key = self._signatures.get(node)
+        if key is None:
+            key = self._signatures[node] = self.cost_model().node_signature(node) or ''
+        if key:
+            self.feedback.record(key, rows)
+
+    def _observe_scan(self, table: str, predicates: list, rows: int):
+        key = (table, tuple(predicates))
+        signature = self._scan_signatures.get(key)
+        if signature is None:
+            signature = self._scan_signatures[key] = self.cost_model().signature({table}, predicates)
+        self.feedback.record(signature, rows)
+
+    def _morsels(self, total: int) -> list:
+        # faixas [início, fim) de até morsel_size linhas; uma só faixa quando não vale paralelizar
+        if self.degree == 1 or total <= self.morsel_size:
+            return [(0, total)]
+        return [(start, min(start + self.morsel_size, total)) for start in range(0, total, self.morsel_size)]
+
+    def _table_columns(self, table: str) -> List[str]:
+        if table not in self.tables or table not in self.metadata:
+            raise ValueError(f"Tabela '{table}' não tem dados carregados.")
+        return [f"{table}.{column}" for column in self.metadata[table]]
+
+    def output_columns(self, node: Node) -> List[str]:
+        # colunas produzidas por um nó, sem executá-lo
+        if node.node_type == 'Tabela':
+            return self._table_columns(node.value.strip().lower())
+        if node.node_type in ('σ', 'Bloom', 'Cache'):
+            return self.output_columns(node.children[0])
+        if node.node_type == 'π':
+            columns = self.output_columns(node.children[0])
+            return [columns[i] for i in projection_indexes(node.value, columns)]
+        if node.node_type == '⨝':
+            return self.output_columns(node.children[0]) + self.output_columns(node.children[1])
+        if node.node_type in ('γ', 'γ parcial'):
+            return compile_aggregation(node.value, self.output_columns(node.children[0]))[2]
+        if node.node_type in ('τ', 'Limite', 'Top-K'):
+            return self.output_columns(node.children[0])
+        raise ValueError(f"Operador '{node.node_type}' não suportado na execução.")
+
+    def execute(self, node: Node) -> Relation:
+        self.bloom_stats = {}
+        self.replans = []
+        if self.cache is not None:
+            # o resultado final também fica no cache
+            return self._materialize(node.children[0] if node.node_type == 'Cache' else node, {})
+        return self._execute(node, {})
+
+    def _cache_keys_of(self, node: Node):
+        # (chave da entrada com todas as colunas ou None, impressão digital):
+        # seleções/junções sem tabela repetida têm as duas
+        entry = self._cache_keys.get(node)
+        if entry is None:
+            key, all_columns = cache_key(node, self.cost_model())
+            entry = self._cache_keys[node] = (key, fingerprint(node)) if all_columns else (None, key)
+        return entry
+
+    def cached_key(self, node: Node):
+        # chave da entrada já no cache para a sub-árvore (None se não houver)
+        for key in self._cache_keys_of(node)[::-1]:
+            if key is not None and key in self.cache:
+                return key
+        return None
+
+    def _materializes_join(self, node: Node) -> bool:
+        # a política decide se a sub-árvore é guardada com todas as colunas
+        key = self._cache_keys_of(node)[0]
+        if key is None or self.cache_joins == "final":
+            return False
+        if self.cache_joins == "all" or key in self._seen_joins:
+            return True
+        self._seen_joins.add(key)
+        return False
+
+    def _materialize(self, node: Node, filters: dict) -> Relation:
+        # resultado da sub-árvore pelo cache; na falta executa e guarda: com
+        # todas as colunas (sem as projeções intermediárias) quando a política
+        # materializa a junção, senão só as colunas do nó
+        full_key, key = self._cache_keys_of(node)
+        relation = self.cache.get(key)
+        if relation is not None:
+            return relation
+        all_columns = full_key is not None and (full_key in self.cache or self._materializes_join(node))
+        if all_columns:
+            key = full_key
+            relation = self.cache.get(key)
+        if relation is None:
+            source = node
+            if all_columns:
+                source = self._full_sources.get(node)
+                if source is None:
+                    source = self._full_sources[node] = _without_projections(node)
+            relation = self._execute(source, filters, materialize=False)
+            if not bloom_sources(node) & filters.keys():
+                # com filtro de Bloom vindo de fora o resultado depende da consulta
+                self.cache.put(key, relation, get_tables(node))
+        if all_columns:
+            # entrada com todas as colunas, talvez de outra ordem de junção:
+            # projeta pelo nome as que o nó produz, na ordem dele
+            columns = self.output_columns(node)
+            if columns != relation.columns:
+                ops, columns = compile_steps(relation.columns, [('π', ', '.join(columns))])
+                relation = Relation(columns, apply_steps(relation.rows, ops))
+        return relation
+
+    def _record(self, stats: dict):
+        if stats:
+            with self._stats_lock:
+                record_bloom_stats(self.bloom_stats, stats)
+
+    def _execute(self, node: Node, filters: dict, materialize: bool = True) -> Relation:
+        # 'filters' são os filtros de Bloom já construídos, por chave de construção
+        if node.node_type == 'Cache':
+            if self.cache is None:
+                return self._execute(node.children[0], filters)
+            return self._materialize(node.children[0], filters)
+        if (node.node_type == '⨝' and self.cache is not None and materialize
+                and (self.cached_key(node) is not None or self._materializes_join(node))):
+            # junções são os pontos de materialização reaproveitáveis
+            return self._materialize(node, filters)
+        pipeline = scan_pipeline(node)
+        if pipeline is not None:
+            return self._run_pipeline(*pipeline, filters)
+        if node.node_type in ('σ', 'π', 'Bloom'):
+            child = self._execute(node.children[0], filters)
+            ops, columns = compile_steps(child.columns, [(node.node_type, node.value)])
+            stats = {}
+            rows = apply_steps(child.rows, ops, filters, stats)
+            self._record(stats)
+            if node.node_type == 'σ' and self.feedback is not None and not bloom_sources(node) & filters.keys():
+                self._observe(node, len(rows))
+            return Relation(columns, rows)
+        if node.node_type == '⨝':
+            relation = self._join(node, filters)
+            # com filtro de Bloom vindo de fora a contagem não vale para a sub-árvore
+            if self.feedback is not None and not bloom_sources(node) & filters.keys():
+                self._observe(node, len(relation.rows))
+            return relation
+        if node.node_type in ('γ', 'γ parcial'):
+            child = self._execute(node.children[0], filters)
+            key_indexes, specs, columns = compile_aggregation(node.value, child.columns)
+            return Relation(columns, aggregate_rows(child.rows, key_indexes, specs))
+        if node.node_type == 'τ':
+            child = self._execute(node.children[0], filters)
+            return Relation(child.columns, sort_rows(child.rows, parse_order(node.value, child.columns)))
+        if node.node_type == 'Limite':
+            child = self._execute(node.children[0], filters)
+            return Relation(child.columns, child.rows[:int(node.value)])
+        if node.node_type == 'Top-K':
+            limit, order = node.value.split(';', 1)
+            child = self._execute(node.children[0], filters)
+            return Relation(child.columns, top_k(child.rows, int(limit), parse_order(order.strip(), child.columns)))
+        raise ValueError(f"Operador '{node.node_type}' não suportado na execução.")
+
+    def _run_pipeline(self, table: str, steps: list, filters: dict, probe=None, build_columns=None) -> Relation:
+        base_columns = self._table_columns(table)
+        ops, columns = compile_steps(base_columns, steps)
+        if build_columns:
+            columns = columns + build_columns
+        # só os filtros usados nesta varredura vão para os workers
+        filters = _used_filters(steps, filters)
+
+        # cardinalidade da seleção, antes do probe (só sem filtro de Bloom ativo)
+        predicates = [conjunct for kind, value in steps if kind == 'σ' for conjunct in split_conjuncts(value)]
+        observe = self.feedback is not None and predicates and not filters
+
+        ranges = self._morsels(len(self.tables[table]))
+        if len(ranges) == 1:
+            stats = {}
+            rows = apply_steps(self.tables[table], ops, filters, stats)
+            self._record(stats)
+            if observe:
+                self._observe_scan(table, predicates, len(rows))
+            if probe is not None:
+                rows = probe_rows(rows, *probe)
+            return Relation(columns, rows)
+
+        # GATHER: concatena na ordem dos morsels
+        rows = []
+        scanned = 0
+        payload = (table, base_columns, steps, probe, filters)
+        for morsel_rows, stats, morsel_scanned in self._map_morsels(_pipeline_morsel, payload, table, ranges):
+            rows.extend(morsel_rows)
+            scanned += morsel_scanned
+            self._record(stats)
+        if observe:
+            self._observe_scan(table, predicates, scanned)
+        return Relation(columns, rows)
+
+    def _partitioned_build(self, table: str, steps: list, key_index: int, filters: dict):
+        # construção paralela do lado de construção (varredura com morsels):
+        # cada worker divide as linhas do seu morsel pela partição da chave e a
+        # tabela hash de cada partição junta as linhas dela de todos os morsels.
+        # Devolve (relação do lado de construção, tabela hash particionada)
+        base_columns = self._table_columns(table)
+        columns = compile_steps(base_columns, steps)[1]
+        filters = _used_filters(steps, filters)
+        predicates = [conjunct for kind, value in steps if kind == 'σ' for conjunct in split_conjuncts(value)]
+        payload = (table, base_columns, steps, key_index, self.degree, filters)
+        parts = [[] for _ in range(self.degree)]
+        scanned = 0
+        for morsel_parts, stats, morsel_scanned in self._map_morsels(_build_morsel, payload, table,
+                                                                     self._morsels(len(self.tables[table]))):
+            for part, rows in zip(parts, morsel_parts):
+                part.extend(rows)
+            scanned += morsel_scanned
+            self._record(stats)
+        if self.feedback is not None and predicates and not filters:
+            self._observe_scan(table, predicates, scanned)
+        hash_table = PartitionedHashTable([build_hash_table(part, key_index) for part in parts])
+        return Relation(columns, [row for part in parts for row in part]), hash_table
+
+    def _parallel_scan(self, pipeline) -> bool:
+        return pipeline is not None and len(self._morsels(len(self.tables.get(pipeline[0], [])))) > 1
+
+    def _execute_pair(self, left_node: Node, right_node: Node, filters: dict):
+        # subárvores independentes de uma árvore "bushy" rodam ao mesmo tempo
+        if self.degree > 1 and _contains_join(left_node) and _contains_join(right_node):
+            with ThreadPoolExecutor(max_workers=1) as side:
+                left_future = side.submit(self._execute, left_node, filters)
+                right = self._execute(right_node, filters)
+                return left_future.result(), right
+        return self._execute(left_node, filters), self._execute(right_node, filters)
+
+    def _join(self, node: Node, filters: dict) -> Relation:
+        left_node, right_node = node.children
+        right_columns = self.output_columns(right_node)
+        keys = equi_join_keys(node.value, self.output_columns(left_node), right_columns)
+
+        if keys is None:
+            # junção genérica: laço aninhado com a condição compilada
+            left, right = self._execute_pair(left_node, right_node, filters)
+            columns = left.columns + right.columns
+            predicate = compile_condition(node.value, columns)
+            rows = [l + r for l in left.rows for r in right.rows if predicate(l + r)]
+            return Relation(columns, rows)
+
+        # hash join: constrói a tabela hash com o lado direito e sonda com o esquerdo
+        left_key, right_key = keys
+        left_pipeline = scan_pipeline(left_node)
+        right_pipeline = scan_pipeline(right_node)
+        source = right_columns[right_key]
+        reduced = source in bloom_sources(left_node)
+        if left_pipeline is not None or reduced or self._parallel_scan(right_pipeline):
+            # lado de construção primeiro; se o lado esquerdo usa as chaves dele
+            # como filtro de Bloom, o filtro sai da tabela hash já montada
+            expected = _planned_rows(right_node) if self.feedback is not None else None
+            hash_table = None
+            if self._parallel_scan(right_pipeline):
+                right, hash_table = self._partitioned_build(*right_pipeline, right_key, filters)
+            else:
+                right = self._execute(right_node, filters)
+            if expected is not None and not reduced and self._far_above(len(right.rows), expected):
+                # replanejamento: o lado de construção saiu bem maior que o
+                # estimado; executa o outro lado e constrói com o menor
+                left = self._execute(left_node, filters)
+                if len(left.rows) < len(right.rows):
+                    self.replans.append(f"JUNÇÃO {node.value}: lado de construção trocado "
+                                        f"({len(right.rows)} linhas, {expected:.0f} estimadas).")
+                return self._hash_join(left, right, left_key, right_key)
+            if hash_table is None:
+                hash_table = build_hash_table(right.rows, right_key)
+            if reduced:
+                filters = {**filters, source: bloom_from_table(hash_table)}
+            if left_pipeline is not None:
+                # o probe roda dentro dos morsels da varredura do lado esquerdo
+                return self._run_pipeline(*left_pipeline, filters, probe=(left_key, hash_table),
+                                          build_columns=right.columns)
+            left = self._execute(left_node, filters)
+            return Relation(left.columns + right.columns, probe_rows(left.rows, left_key, hash_table))
+
+        left, right = self._execute_pair(left_node, right_node, filters)
+        if self.feedback is not None:
+            # os dois lados já estão materializados: constrói com o menor
+            return self._hash_join(left, right, left_key, right_key)
+        hash_table = build_hash_table(right.rows, right_key)
+        return Relation(left.columns + right.columns, probe_rows(left.rows, left_key, hash_table))
+
+    def _far_above(self, actual: int, expected: float) -> bool:
+        return actual >= REPLAN_MIN_ROWS and actual > REPLAN_FACTOR * max(expected, 1.0)
+
+    def _hash_join(self, left: Relation, right: Relation, left_key: int, right_key: int) -> Relation:
+        # hash join com os dois lados materializados; a tabela hash fica com o menor.
+        # A sonda de linhas já materializadas roda no coordenador: mandá-las para
+        # os workers e receber o resultado custaria mais que a própria sonda
+        columns = left.columns + right.columns
+        if len(left.rows) < len(right.rows):
+            hash_table = build_hash_table(left.rows, left_key)
+            return Relation(columns, probe_rows(right.rows, right_key, hash_table, build_first=True))
+        hash_table = build_hash_table(right.rows, right_key)
+        return Relation(columns, probe_rows(left.rows, left_key, hash_table))
+
+    # Plano Físico
+    # mesma ordem do generate_execution_plan (pós-ordem), mas com as decisões
+    # da execução: hash join, morsels e os pontos de EXCHANGE/GATHER
+    def physical_plan(self, node: Node) -> list:
+        plan = []
+        self._plan_node(node, plan)
+        return plan
+
+    def _plan_node(self, node: Node, plan: list, probe: str = None):
+        pipeline = scan_pipeline(node)
+        if pipeline is not None:
+            table, steps = pipeline
+            parallel = len(self._morsels(len(self.tables.get(table, [])))) > 1
+            if parallel:
+                morsels = len(self._morsels(len(self.tables[table])))
+                plan.append(f"Varredura PARALELA da tabela '{table}': {morsels} morsels de até "
+                            f"{self.morsel_size} linhas em {self.degree} workers.")
+            else:
+                plan.append(f"Acessar a tabela '{table}'.")
+            suffix = " (em cada morsel)" if parallel else ""
+            for kind, value in steps:
+                if kind == 'σ':
+                    plan.append(f"Aplicar SELEÇÃO com a condição: {value}{suffix}.")
+                elif kind == 'Bloom':
+                    plan.append(f"Descartar linhas com filtro de Bloom (semi-junção): {value}{suffix}.")
+                else:
+                    plan.append(f"Projetar os seguintes atributos: {value}{suffix}.")
+            if probe is not None:
+                plan.append(f"Sondar a tabela hash da JUNÇÃO com a condição: {probe}{suffix}.")
+            if parallel:
+                plan.append(f"GATHER: reunir os morsels da tabela '{table}'.")
+            return
+
+        if node.node_type == 'Cache':
+            if self.cache is not None and self.cached_key(node.children[0]) is not None:
+                plan.append(f"Reutilizar o resultado materializado em cache: {node.value}.")
+                return
+            self._plan_node(node.children[0], plan)
+            plan.append(f"Materializar o resultado no cache: {node.value}.")
+            return
+
+        if node.node_type != '⨝':
+            # σ/π/Bloom sobre junção, γ, τ, Limite e Top-K rodam no coordenador
+            self._plan_node(node.children[0], plan)
+            plan.append(describe_step(node))
+            return
+
+        left_node, right_node = node.children
+        right_columns = self.output_columns(right_node)
+        keys = equi_join_keys(node.value, self.output_columns(left_node), right_columns)
+        # com filtro de Bloom o lado esquerdo espera a tabela hash do direito
+        reduced = keys is not None and right_columns[keys[1]] in bloom_sources(left_node)
+        bushy = self.degree > 1 and _contains_join(left_node) and _contains_join(right_node) and not reduced
+        if bushy:
+            plan.append("EXCHANGE: executar as duas subárvores da JUNÇÃO em paralelo.")
+
+        if keys is None:
+            self._plan_node(left_node, plan)
+            self._plan_node(right_node, plan)
+            if bushy:
+                plan.append("GATHER: aguardar as duas subárvores.")
+            plan.append(f"Realizar JUNÇÃO (laço aninhado) com a condição: {node.value}.")
+            return
+
+        left_pipeline = scan_pipeline(left_node)
+        # o lado direito (construção) é executado antes do esquerdo (probe)
+        self._plan_node(right_node, plan)
+        if self._parallel_scan(scan_pipeline(right_node)):
+            plan.append(f"Construir a tabela hash da JUNÇÃO com a condição: {node.value}, em {self.degree} "
+                        f"partições pela chave (cada worker divide as linhas do seu morsel).")
+        else:
+            plan.append(f"Construir a tabela hash da JUNÇÃO com a condição: {node.value}.")
+        if reduced:
+            plan.append(f"Construir filtro de Bloom com as chaves de {right_columns[keys[1]]} (semi-junção).")
+
+        if left_pipeline is not None:
+            if self._parallel_scan(left_pipeline):
+                plan.append("Enviar a tabela hash e os filtros uma vez para os workers (memória compartilhada).")
+            self._plan_node(left_node, plan, probe=node.value)
+            return
+        self._plan_node(left_node, plan)
+        if bushy:
+            plan.append("GATHER: aguardar as duas subárvores.")
+        plan.append(f"Sondar a tabela hash da JUNÇÃO com a condição: {node.value}.")
+
+
+def execute_query(graph: Node, metadata: Dict[str, List[str]], tables: Dict[str, list],
+                  degree: int = 1, morsel_size: int = MORSEL_SIZE, pool: str = "process",
+                  cache: ResultCache = None, feedback: CardinalityFeedback = None,
+                  cache_joins: str = "final") -> Relation:
+    with QueryExecutor(metadata, tables, degree, morsel_size, pool, cache, feedback, cache_joins) as executor:
+        return executor.execute(graph)
@@ -1,17 +1,60 @@
+import hashlib
 import re
 import textwrap 
 from typing import List, Dict
 
+from cost_model import CostModel, condition_columns, qualify, split_conjuncts
+
+# funções de agregação aceitas no SELECT e no ORDER BY
+AGGREGATE_PATTERN = re.compile(r'\b(?:count|sum|avg|min|max)\([^()]*\)')
+
+def split_top_level(text: str, separator: str = ',') -> list:
+    # divide pelo separador só fora de parênteses (ex: "avg(a, b), count(*)")
+    parts, level, current = [], 0, ''
+    for char in text:
+        if char == '(':
+            level += 1
+        elif char == ')':
+            level -= 1
+        if char == separator and level == 0:
+            parts.append(current.strip())
+            current = ''
+        else:
+            current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+def parse_aggregate_value(value: str):
+    # valor de um nó γ: "chaves; agregações" -> (lista de chaves, lista de agregações)
+    keys_part, aggregates_part = value.split(';', 1)
+    return split_top_level(keys_part), split_top_level(aggregates_part)
+
+def _normalize_expression(text: str) -> str:
+    # tira os espaços em volta dos parênteses: "count( * )" -> "count(*)"
+    text = re.sub(r'\s*\(\s*', '(', text)
+    return re.sub(r'\s*\)', ')', text).strip()
+
 # Conversão para Álgebra Relacional (HU2)
 def convert_to_relational_algebra(query: str) -> str:
     # converte tudo para minúsculo
     normalized_query = ' '.join(query.lower().split())
+
+    # separa as cláusulas do final (GROUP BY, ORDER BY e LIMIT, nessa ordem)
+    # o resto ("select ... from ... where ...") continua sendo tratado como antes
+    # procura as cláusulas com os literais mascarados (mesmo tamanho) e recorta
+    # a consulta original pelas posições, para "nome = 'order by x'" não contar
+    masked_query = re.sub(r"'[^']*'", lambda m: "'" + '_' * (len(m.group(0)) - 2) + "'", normalized_query)
+    clauses = re.match(r'(.*?)(?:\s+group\s+by\s+(.*?))?(?:\s+order\s+by\s+(.*?))?(?:\s+limit\s+(\d+))?$', masked_query)
+    normalized_query, group_part, order_part, limit_part = (
+        normalized_query[clauses.start(i):clauses.end(i)] if clauses.group(i) is not None else None
+        for i in range(1, 5))
     
     # extrai as partes da query usando regex
     # re.search() encontra o primeiro padrão que bater, o .group(1) pega o conteúdo do primeiro parentesis (.*?)
     
     # pega o que ta entre "select" e "from"
-    select_part = re.search(r'select\s+(.*?)\s+from', normalized_query).group(1)
+    select_part = _normalize_expression(re.search(r'select\s+(.*?)\s+from', normalized_query).group(1))
     
     # pega o que ta entre "from" e "where" ou o fim da string
     from_part = re.search(r'from\s+(.*?)(?:\s+where|$)', normalized_query).group(1)
@@ -40,21 +83,42 @@ def convert_to_relational_algebra(query: str) -> str:
     # Se uma WHERE foi encontrada, junta a expressão com um Sigma (σ).
     if where_part:
         rel_alg_expr = f"σ {where_part.strip()} ({rel_alg_expr})"
+
+    # agregações usadas no SELECT ou no ORDER BY (sem repetir, na ordem em que aparecem)
+    order_part = _normalize_expression(order_part) if order_part else None
+    aggregates = list(dict.fromkeys(AGGREGATE_PATTERN.findall(f"{select_part} {order_part or ''}")))
+
+    # se tem GROUP BY ou alguma agregação, junta a expressão com um Gama (γ).
+    # o valor fica "chaves; agregações" (sem GROUP BY as chaves ficam vazias)
+    if group_part or aggregates:
+        group_keys = ', '.join(split_top_level(group_part)) if group_part else ''
+        rel_alg_expr = f"γ {group_keys}; {', '.join(aggregates)} ({rel_alg_expr})"
+
+    # ORDER BY vira um Tau (τ), abaixo da projeção para poder ordenar por
+    # atributos que não estão no SELECT
+    if order_part:
+        rel_alg_expr = f"τ {order_part} ({rel_alg_expr})"
         
     # dai junta a expressão com o Pi (π) da cláusula SELECT.
-    rel_alg_expr = f"π {select_part.strip()} ({rel_alg_expr})"
+    rel_alg_expr = f"π {select_part} ({rel_alg_expr})"
+
+    # LIMIT fica por último (o otimizador empurra ele para baixo do π)
+    if limit_part:
+        rel_alg_expr = f"Limite {limit_part} ({rel_alg_expr})"
     
     return rel_alg_expr
 
 #Grafo de Operadores (HU3 e HU4)
 class Node:
     def __init__(self, node_type, value, children=None):
-        # tipo de nó (π , σ , ⨝, Tabela)
+        # tipo de nó (π , σ , ⨝, γ, τ, Limite, Bloom, Cache, Tabela...)
         self.node_type = node_type
         # valor ou condição do nó (ex: "cliente.nome" ou "id = 1")
         self.value = value
         # a lista de nós filhos 
         self.children = children if children is not None else []
+        # linhas estimadas pelo modelo de custo ao ordenar as junções (None se não estimou)
+        self.estimated_rows = None
         #id (debug)
         self.id = id(self)
 
@@ -99,30 +163,45 @@ class Node:
         build_mermaid_string_v2(self)
         return mermaid_string
     
+# símbolos dos operadores de um filho só, como aparecem na álgebra relacional
+UNARY_OPERATORS = ("π", "σ", "γ", "τ", "Limite")
+
+def _find_child_open_paren(rel_alg_expr: str) -> int:
+    # anda de trás para frente contando parênteses (fora de literais 'texto')
+    paren_level = 0
+    in_literal = False
+    for i in range(len(rel_alg_expr) - 1, -1, -1):
+        char = rel_alg_expr[i]
+        if char == "'":
+            in_literal = not in_literal
+        elif in_literal:
+            continue
+        elif char == ')':
+            paren_level += 1
+        elif char == '(':
+            paren_level -= 1
+            if paren_level == 0:
+                return i
+    return -1
+
 #Grafo de Operadores (HU3)
 def build_operator_graph(rel_alg_expr: str) -> Node:
     # remove os espaços em branco no começo e no fim
     rel_alg_expr = rel_alg_expr.strip()
     
-    # tenta dar "match" com o padrão de pi
-    # re.DOTALL faz com que o '.' (ponto) também inclua quebras de linha
-    # re.IGNORECASE ignora maiúsculas/minúsculas
-    pi_match = re.match(r'π\s+(.*?)\s*\((.*)\)', rel_alg_expr, re.DOTALL | re.IGNORECASE)
-    if pi_match:
-        attributes = pi_match.group(1).strip() # os atributos
-        child_expr = pi_match.group(2).strip()  # o resto da expressão
-        # Retorna um nó pi e chama recursivamente a função para construir o filho
-        return Node("π", attributes, [build_operator_graph(child_expr)])
-
-    # Se não for pi, tenta dar "match" com o padrão de seleção
-    sigma_match = re.match(r'σ\s+(.*?)\s*\((.*)\)', rel_alg_expr, re.DOTALL | re.IGNORECASE)
-    if sigma_match:
-        condition = sigma_match.group(1).strip() #  condição
-        child_expr = sigma_match.group(2).strip()  # o resto da expressão
-        # Retorna um nó 'σ' e chama recursivamente a função para construir o filho
-        return Node("σ", condition, [build_operator_graph(child_expr)])
-
-    # Se não for π ou σ, tenta dar "match" com Junção
+    # operadores unários: "símbolo valor (filho)"
+    # o filho é o último grupo de parênteses, então procura o '(' que fecha com o ')' final.
+    # (o valor também pode ter parênteses, ex: "π cliente.nome, count(*)")
+    for symbol in UNARY_OPERATORS:
+        if rel_alg_expr.startswith(symbol + ' ') and rel_alg_expr.endswith(')'):
+            open_index = _find_child_open_paren(rel_alg_expr)
+            if open_index > len(symbol):
+                value = rel_alg_expr[len(symbol):open_index].strip() # atributos, condição, chaves...
+                child_expr = rel_alg_expr[open_index + 1:-1].strip()  # o resto da expressão
+                # Retorna o nó e chama recursivamente a função para construir o filho
+                return Node(symbol, value, [build_operator_graph(child_expr)])
+
+    # Se não for um operador unário, tenta dar "match" com Junção
     # junções sempre começam e terminam com parênteses
     if rel_alg_expr.startswith('(') and rel_alg_expr.endswith(')'):
         #remove os parênteses externos
@@ -154,7 +233,7 @@ def build_operator_graph(rel_alg_expr: str) -> Node:
             else:
                 return Node("⨝", "condição?", [build_operator_graph(left_expr), build_operator_graph(rest)])
 
-    # se não for π, σ, ou ⨝, deve ser um nó Tabela que não tem filhos
+    # se não for nenhum operador nem ⨝, deve ser um nó Tabela que não tem filhos
     return Node("Tabela", rel_alg_expr)
 
 # Otimização (HU4)
@@ -180,14 +259,51 @@ def _collect_all_attributes(node: Node) -> set:
     # Retorna o conjunto completo de atributos
     return attrs
 
-def optimize_graph(node: Node, metadata: Dict[str, List[str]], needed_attrs: set) -> Node:
+def optimize_graph(node: Node, metadata: Dict[str, List[str]], needed_attrs: set, cache=None,
+                   cost_model: CostModel = None) -> Node:
     print(">>> Otimização: Iniciando...")
+    # sem estatísticas nem realimentação, as estimativas usam só as fórmulas
+    cost_model = cost_model or CostModel(metadata)
+
+    # Com SELECT * todas as colunas saem, na ordem do FROM: não há projeções
+    # intermediárias, e o '*' vira a lista qualificada das colunas nessa ordem
+    # (o π projeta pelo nome), então as junções podem mudar de ordem e de lado.
+    # Só com tabela repetida o '*' fica (nomes ambíguos): aí nada muda de ordem
+    selects_all = _projects_all(node)
+    if selects_all:
+        node = _expand_star(node, metadata)
+    keeps_order = _projects_all(node)
+
     #Aplica a heurística de "Empurrar Seleções" (Selection Pushdown)
     optimized_node = _push_selections_down(node, metadata)
+
+    # Ordem das junções escolhida pelo modelo de custo (gulosa), com as seleções
+    # descendo até as tabelas
+    if not keeps_order:
+        optimized_node = _reorder_joins(optimized_node, metadata, cost_model)
     
     # Aplica a heurística de "Adicionar Projeções Intermediárias"
     # insere 'π' para descartar colunas desnecessárias o mais cedo possível.
-    final_optimized_node = _add_intermediate_projections(optimized_node, metadata, needed_attrs)
+    final_optimized_node = optimized_node
+    if not selects_all:
+        final_optimized_node = _add_intermediate_projections(optimized_node, metadata, needed_attrs)
+
+    # Empurra o LIMIT para baixo das projeções e troca ORDER BY + LIMIT por Top-K
+    # (heap limitado em vez de ordenar tudo)
+    final_optimized_node = _push_limit_down(final_optimized_node)
+
+    # Agregação parcial abaixo da junção, quando as chaves de agrupamento permitem
+    final_optimized_node = _push_partial_aggregation(final_optimized_node, metadata)
+
+    # Redutores de semi-junção: filtros de Bloom com as chaves do lado filtrado
+    # descem pelo outro lado da junção até as varreduras
+    final_optimized_node = _add_semi_join_reducers(final_optimized_node, metadata, cost_model,
+                                                   swap_sides=not keeps_order)
+
+    # Sub-árvores com resultado já materializado no cache (result_cache.ResultCache)
+    # são lidas de lá em vez de recalculadas
+    if cache is not None:
+        final_optimized_node = _substitute_cached_subtrees(final_optimized_node, cache, cost_model)
     
     # Retorna a raiz da nova árvore, agora otimizada.
     return final_optimized_node
@@ -280,6 +396,154 @@ def _push_selections_down(node: Node, metadata: Dict[str, List[str]]) -> Node:
     # se não for o padrão σ -> ⨝, apenas retorna o nó
     return node
 
+def _expand_star(node: Node, metadata: Dict[str, List[str]]) -> Node:
+    # '*' do π -> colunas qualificadas das tabelas abaixo, na ordem do FROM
+    # (as folhas da árvore ainda não reordenada); com tabela repetida fica '*'
+    if node.node_type == 'π':
+        items = split_top_level(node.value)
+        leaves = _table_leaves(node)
+        if '*' in items and len(set(leaves)) == len(leaves):
+            columns = [f"{table}.{column}" for table in leaves for column in metadata.get(table, [])]
+            node.value = ', '.join(column for item in items for column in (columns if item == '*' else [item]))
+    node.children = [_expand_star(c, metadata) for c in node.children]
+    return node
+
+def _projects_all(node: Node) -> bool:
+    # SELECT *: um item '*' sozinho na lista do π (não o de count(*))
+    return ((node.node_type == 'π' and '*' in split_top_level(node.value))
+            or any(_projects_all(c) for c in node.children))
+
+def _condition_leaves(condition: str, leaf_tables: list, metadata: Dict[str, List[str]]):
+    # índices das folhas citadas pela condição (None se algum atributo for ambíguo)
+    leaves = set()
+    for column in condition_columns(condition):
+        if '.' in column:
+            table = column.split('.')[0]
+            owners = [i for i, tables in enumerate(leaf_tables) if table in tables]
+        else:
+            owners = [i for i, tables in enumerate(leaf_tables)
+                      for table in tables if column in metadata.get(table, [])]
+        if len(owners) != 1:
+            return None
+        leaves.add(owners[0])
+    return leaves
+
+def _greedy_join_order(leaves: list, conditions: list, metadata: Dict[str, List[str]], cost_model: CostModel):
+    # a cada passo junta o par de componentes (folhas ou junções já feitas)
+    # ligados por uma igualdade que gera o menor resultado estimado: dois pares
+    # baratos e independentes viram subárvores separadas (árvore "bushy"), que
+    # o executor paralelo roda ao mesmo tempo.
+    # Devolve None quando não dá para reordenar sem mudar o resultado
+    leaf_tables = [get_tables(leaf) for leaf in leaves]
+    if len(set().union(*leaf_tables)) != sum(len(tables) for tables in leaf_tables):
+        # tabela repetida: os atributos qualificados seriam ambíguos
+        return None
+
+    placed = []
+    for condition in conditions:
+        owners = _condition_leaves(condition, leaf_tables, metadata)
+        if owners is None:
+            return None
+        placed.append((condition, owners))
+
+    # condições de uma folha só descem como seleção sobre ela
+    for i, leaf in enumerate(leaves):
+        local = [condition for condition, owners in placed if owners == {i}]
+        if local:
+            if leaf.node_type == 'σ':
+                leaves[i] = Node("σ", " AND ".join([leaf.value] + local), leaf.children)
+            else:
+                leaves[i] = Node("σ", " AND ".join(local), [leaf])
+    placed = [(condition, owners) for condition, owners in placed if len(owners) > 1]
+
+    components = {}
+    for i, leaf in enumerate(leaves):
+        # predicados None: folha com γ/τ/Limite, sem assinatura
+        rows, _, predicates = cost_model.describe(leaf)
+        components[i] = (leaf, leaf_tables[i], predicates, rows)
+        leaf.estimated_rows = rows
+
+    def linking(left: set, right: set) -> list:
+        # condições que passam a ter todas as folhas ao juntar os dois componentes
+        return [condition for condition, owners in placed
+                if owners & left and owners & right and owners <= left | right]
+
+    def is_equality(condition: str) -> bool:
+        return EQUALITY_PATTERN.match(condition.lower()) is not None
+
+    def estimate(left, right, conditions):
+        return cost_model.estimate_join(left[1:], right[1:], conditions)
+
+    def combine(left, right, conditions, rows):
+        # o lado menor fica à direita: é ele que vira a tabela hash na execução
+        if left[3] < right[3]:
+            left, right = right, left
+        join_condition = next(c for c in conditions if is_equality(c))
+        node = Node("⨝", join_condition, [left[0], right[0]])
+        node.estimated_rows = rows
+        rest = [c for c in conditions if c is not join_condition]
+        if rest:
+            node = Node("σ", " AND ".join(rest), [node])
+            node.estimated_rows = rows
+        tables = left[1] | right[1]
+        if left[2] is None or right[2] is None:
+            return (node, tables, None, rows)
+        return (node, tables, left[2] | right[2] | cost_model.normalize_all(conditions, tables), rows)
+
+    # folhas de cada componente e componente de cada folha; a estimativa de um
+    # par só muda quando um dos dois é juntado (e aí ganha um novo número)
+    members = {i: {i} for i in components}
+    owner = {i: i for i in components}
+    estimates = {}
+    next_id = len(leaves)
+    equalities = [owners for condition, owners in placed if is_equality(condition)]
+    while len(components) > 1:
+        best = None
+        for owners in equalities:
+            pair = tuple(sorted({owner[leaf] for leaf in owners}))
+            if len(pair) != 2:
+                continue
+            if pair not in estimates:
+                conditions_ab = linking(members[pair[0]], members[pair[1]])
+                estimates[pair] = (estimate(components[pair[0]], components[pair[1]], conditions_ab), conditions_ab)
+            rows, conditions_ab = estimates[pair]
+            if best is None or rows < best[0]:
+                best = (rows, pair, conditions_ab)
+        if best is None:
+            # grafo desconexo (produto cartesiano): mantém a ordem original
+            return None
+        rows, (a, b), conditions_ab = best
+        merged = next_id
+        next_id += 1
+        components[merged] = combine(components.pop(a), components.pop(b), conditions_ab, rows)
+        members[merged] = members.pop(a) | members.pop(b)
+        for leaf in members[merged]:
+            owner[leaf] = merged
+    return next(iter(components.values()))[0]
+
+def _reorder_joins(node: Node, metadata: Dict[str, List[str]], cost_model: CostModel) -> Node:
+    # uma região é um bloco de junções (e seleções entre elas) sem outro operador no meio
+    starts_region = node.node_type == '⨝' or (node.node_type == 'σ' and node.children[0].node_type == '⨝')
+    if not starts_region:
+        node.children = [_reorder_joins(c, metadata, cost_model) for c in node.children]
+        return node
+
+    leaves, conditions = [], []
+    def flatten(n):
+        if n.node_type == '⨝' or (n.node_type == 'σ' and n.children[0].node_type == '⨝'):
+            conditions.extend(split_conjuncts(n.value))
+            for c in n.children:
+                flatten(c)
+        else:
+            leaves.append(n)
+    flatten(node)
+
+    # as folhas não começam região: a recursão só altera os filhos delas
+    for leaf in leaves:
+        _reorder_joins(leaf, metadata, cost_model)
+    reordered = _greedy_join_order(list(leaves), conditions, metadata, cost_model)
+    return reordered if reordered is not None else node
+
 def _add_intermediate_projections(node: Node, metadata: Dict[str, List[str]], needed_attrs: set) -> Node:
     
     # se for um nó tabela, para.
@@ -327,30 +591,352 @@ def _add_intermediate_projections(node: Node, metadata: Dict[str, List[str]], ne
     
     return node
 
+def _push_limit_down(node: Node) -> Node:
+    # otimiza os filhos primeiro
+    node.children = [_push_limit_down(child) for child in node.children]
+
+    if node.node_type != 'Limite' or not node.children:
+        return node
+    child = node.children[0]
+
+    # π não muda o número de linhas: Limite(π(x)) = π(Limite(x)),
+    # assim a projeção só roda nas linhas que sobram
+    if child.node_type == 'π':
+        node.children = child.children
+        child.children = [_push_limit_down(node)]
+        return child
+
+    # ORDER BY + LIMIT: só as k primeiras linhas importam (Top-K)
+    if child.node_type == 'τ':
+        return Node("Top-K", f"{node.value}; {child.value}", child.children)
+
+    return node
+
+def _column_side(attr: str, left_tables: set, right_tables: set, metadata: Dict[str, List[str]]):
+    # diz de qual lado da junção vem o atributo ('left', 'right' ou None se ambíguo)
+    if '.' in attr:
+        table = attr.split('.')[0]
+        if table in left_tables and table not in right_tables:
+            return 'left'
+        if table in right_tables and table not in left_tables:
+            return 'right'
+        return None
+    in_left = any(attr in metadata.get(tbl, []) for tbl in left_tables)
+    in_right = any(attr in metadata.get(tbl, []) for tbl in right_tables)
+    if in_left != in_right:
+        return 'left' if in_left else 'right'
+    return None
+
+def get_tables(n: Node) -> set:
+    # tabelas base da sub-árvore (o executor usa para o cache de resultados)
+    if n.node_type == 'Tabela':
+        return {n.value.lower()}
+    tables = set()
+    for c in n.children:
+        tables.update(get_tables(c))
+    return tables
+
+def _push_partial_aggregation(node: Node, metadata: Dict[str, List[str]]) -> Node:
+    # otimiza os filhos primeiro
+    node.children = [_push_partial_aggregation(child, metadata) for child in node.children]
+
+    # só vale para γ logo acima de uma junção (sem σ no meio)
+    if node.node_type != 'γ' or not node.children or node.children[0].node_type != '⨝':
+        return node
+
+    group_keys, aggregates = parse_aggregate_value(node.value)
+    # sem GROUP BY a agregação final sobre zero linhas teria que devolver count = 0
+    if not group_keys:
+        return node
+
+    join_node = node.children[0]
+    sides = {'left': get_tables(join_node.children[0]), 'right': get_tables(join_node.children[1])}
+
+    def side_of(attr):
+        return _column_side(attr, sides['left'], sides['right'], metadata)
+
+    # as agregações precisam usar atributos de um lado só
+    parsed = []
+    aggregate_sides = set()
+    for aggregate in aggregates:
+        match = re.match(r'^(count|sum|avg|min|max)\((.*)\)$', aggregate)
+        # agregação já combinada (com "as") não é empurrada de novo
+        if not match:
+            return node
+        func, arg = match.groups()
+        if arg != '*':
+            aggregate_sides.add(side_of(arg))
+        parsed.append((func, arg))
+    if None in aggregate_sides or len(aggregate_sides) > 1:
+        return node
+
+    key_sides = [side_of(key) for key in group_keys]
+    if None in key_sides:
+        return node
+
+    # lado que recebe a pré-agregação: o das agregações ou, só com count(*),
+    # o lado com menos chaves de agrupamento
+    if aggregate_sides:
+        side = aggregate_sides.pop()
+    else:
+        side = 'right' if key_sides.count('right') <= key_sides.count('left') else 'left'
+
+    # atributos da condição de junção desse lado também viram chaves do γ parcial
+    join_attrs = re.findall(r'\b[a-z_][a-z0-9_.]*\b', re.sub(r"\'(.*?)\'", " ", join_node.value.lower()))
+    join_attrs = [a for a in join_attrs if a not in ('and', 'or')]
+    join_sides = [side_of(a) for a in join_attrs]
+    if not join_attrs or None in join_sides:
+        return node
+    partial_keys = [k for k, k_side in zip(group_keys, key_sides) if k_side == side]
+    partial_keys += [a for a, a_side in zip(join_attrs, join_sides) if a_side == side and a not in partial_keys]
+
+    # se a chave primária de uma tabela sozinha está nas chaves, cada grupo tem uma linha só
+    side_tables = sides[side]
+    if len(side_tables) == 1:
+        table = next(iter(side_tables))
+        if any(k.split('.')[-1] == f"id{table}" for k in partial_keys):
+            return node
+
+    # agregações parciais (abaixo da junção) e como combinar no γ final
+    partial_aggregates = []
+    final_aggregates = []
+    for func, arg in parsed:
+        original = f"{func}({arg})"
+        if func == 'avg':
+            partial_aggregates += [f"sum({arg})", f"count({arg})"]
+            final_aggregates.append(f"avg(sum({arg}), count({arg})) as {original}")
+        else:
+            partial_aggregates.append(original)
+            combine = 'sum' if func == 'count' else func
+            final_aggregates.append(f"{combine}({original}) as {original}")
+    partial_aggregates = list(dict.fromkeys(partial_aggregates))
+
+    index = 0 if side == 'left' else 1
+    join_node.children[index] = Node("γ parcial", f"{', '.join(partial_keys)}; {', '.join(partial_aggregates)}",
+                                     [join_node.children[index]])
+    node.value = f"{', '.join(group_keys)}; {', '.join(final_aggregates)}"
+    return node
+
+EQUALITY_PATTERN = re.compile(r'^\s*([a-z_][a-z0-9_.]*)\s*=\s*([a-z_][a-z0-9_.]*)\s*$')
+
+def parse_bloom_value(value: str):
+    # valor de um nó Bloom: "coluna ∈ chave" -> (coluna filtrada, chave do lado de construção)
+    column, source = value.split('∈', 1)
+    return column.strip(), source.strip()
+
+def _collect_subtrees(node: Node, tables: dict, reduced: set):
+    # tabelas de cada nó e nós com alguma seleção (ou filtro de Bloom) abaixo,
+    # numa passada só de baixo para cima
+    if node.node_type == 'Tabela':
+        tables[node] = {node.value.lower()}
+    else:
+        for child in node.children:
+            _collect_subtrees(child, tables, reduced)
+        tables[node] = set().union(*(tables[c] for c in node.children))
+    if node.node_type in ('σ', 'Bloom') or any(c in reduced for c in node.children):
+        reduced.add(node)
+
+def _lookup(values: dict, node: Node):
+    # valor calculado antes da passada; um Bloom colocado depois tem o do filho
+    while node not in values:
+        node = node.children[0]
+    return values[node]
+
+def _equivalent_columns(node: Node, start: str, metadata: Dict[str, List[str]], subtree_tables: dict) -> set:
+    # colunas iguais a 'start' pelas junções de igualdade da sub-árvore
+    pairs = []
+    def collect(n):
+        if n.node_type == '⨝':
+            match = EQUALITY_PATTERN.match(n.value.lower())
+            if match:
+                tables = _lookup(subtree_tables, n)
+                a, b = (qualify(attr, tables, metadata) for attr in match.groups())
+                if a and b:
+                    pairs.append((a, b))
+        if n.node_type in ('σ', 'π', 'Bloom', '⨝', 'γ parcial'):
+            for c in n.children:
+                collect(c)
+    collect(node)
+
+    equivalent = {start}
+    changed = True
+    while changed:
+        changed = False
+        for a, b in pairs:
+            if (a in equivalent) != (b in equivalent):
+                equivalent.update((a, b))
+                changed = True
+    return equivalent
+
+def _place_bloom(node: Node, equivalent: set, source: str, metadata: Dict[str, List[str]],
+                 reduced: set, below_join: bool = False) -> Node:
+    # coloca o filtro logo acima de cada tabela que tem uma coluna equivalente.
+    # só desce por σ, π e junções internas (γ, τ e Limite mudam o resultado).
+    # Na varredura que sonda a própria junção o filtro não ganha nada: a tabela
+    # hash já descarta a linha com o mesmo custo, então só entra abaixo de outra junção.
+    # Pelo γ parcial passa quando a coluna filtrada é chave de agrupamento (o filtro
+    # descarta grupos inteiros, que a junção descartaria) e poupa a pré-agregação.
+    # 'reduced' ganha os filtros colocados e os nós acima deles
+    if node.node_type == 'Tabela':
+        if not below_join:
+            return node
+        table = node.value.lower()
+        for attr in sorted(equivalent):
+            if attr.split('.')[0] == table and attr.split('.')[-1] in metadata.get(table, []):
+                bloom = Node("Bloom", f"{attr} ∈ {source}", [node])
+                reduced.add(bloom)
+                return bloom
+        return node
+    if node.node_type == 'γ parcial':
+        tables = get_tables(node)
+        keys = {qualify(key, tables, metadata) for key in parse_aggregate_value(node.value)[0]}
+        if keys & equivalent:
+            node.children = [_place_bloom(c, equivalent, source, metadata, reduced, True) for c in node.children]
+    elif node.node_type in ('σ', 'π', 'Bloom', '⨝'):
+        below_join = below_join or node.node_type == '⨝'
+        node.children = [_place_bloom(c, equivalent, source, metadata, reduced, below_join) for c in node.children]
+    if any(c in reduced for c in node.children):
+        reduced.add(node)
+    return node
+
+def _add_semi_join_reducers(node: Node, metadata: Dict[str, List[str]], cost_model: CostModel,
+                            swap_sides: bool = True) -> Node:
+    # tabelas e nós com seleção calculados uma vez, de baixo para cima, e as
+    # estimativas (mais caras) só quando uma troca de lados precisar, também
+    # numa passada só: a passada de cima para baixo só consulta
+    tables, reduced, described = {}, set(), {}
+    _collect_subtrees(node, tables, reduced)
+
+    def estimate(n):
+        if not described:
+            cost_model.describe(node, described)
+        return _lookup(described, n)[0]
+
+    return _place_semi_join_reducers(node, metadata, tables, reduced, estimate, swap_sides)
+
+def _place_semi_join_reducers(node: Node, metadata: Dict[str, List[str]], tables: dict, reduced: set,
+                              estimate, swap_sides: bool) -> Node:
+    if node.node_type == '⨝':
+        match = EQUALITY_PATTERN.match(node.value.lower())
+        if match:
+            left, right = node.children
+            # a execução monta a tabela hash com o filho da direita: o lado com
+            # seleção vai para a direita, assim o filtro reduz o lado sem seleção
+            # (a menos que o modelo de custo estime que ele continua maior).
+            # swap_sides=False mantém a ordem das colunas (SELECT * com tabela repetida)
+            if (swap_sides and left in reduced and right not in reduced
+                    and estimate(left) <= estimate(right)):
+                node.children = [right, left]
+                left, right = right, left
+
+            if right in reduced:
+                left_tables, right_tables = _lookup(tables, left), _lookup(tables, right)
+                a, b = match.groups()
+                if _column_side(a, left_tables, right_tables, metadata) == 'right':
+                    a, b = b, a
+                probe_attr = qualify(a, left_tables, metadata)
+                source = qualify(b, right_tables, metadata)
+                if (probe_attr and source and _column_side(a, left_tables, right_tables, metadata) == 'left'
+                        and _column_side(b, left_tables, right_tables, metadata) == 'right'):
+                    equivalent = _equivalent_columns(left, probe_attr, metadata, tables)
+                    node.children[0] = _place_bloom(left, equivalent, source, metadata, reduced)
+
+    # de cima para baixo: os filtros colocados aqui contam como redução
+    # nas junções de baixo, e o filtro passa adiante pela cadeia de chaves
+    node.children = [_place_semi_join_reducers(c, metadata, tables, reduced, estimate, swap_sides)
+                     for c in node.children]
+    return node
+
+def fingerprint(node: Node) -> str:
+    # impressão digital de uma sub-árvore: mesmo texto normalizado, mesmo resultado.
+    # Filtros de Bloom não entram: só descartam linhas que a junção descartaria
+    # (o executor não guarda resultados que dependem de filtros de fora).
+    # Nós Cache são transparentes
+    def canonical(n):
+        if n.node_type in ('Bloom', 'Cache'):
+            return canonical(n.children[0])
+        value = ' '.join(str(n.value).lower().split())
+        return f"{n.node_type}[{value}](" + ','.join(canonical(c) for c in n.children) + ")"
+    return hashlib.sha1(canonical(node).encode('utf-8')).hexdigest()
+
+def _table_leaves(node: Node) -> list:
+    if node.node_type == 'Tabela':
+        return [node.value.lower()]
+    return [table for c in node.children for table in _table_leaves(c)]
+
+def cache_key(node: Node, cost_model: CostModel):
+    # (chave no cache de resultados, entrada guarda todas as colunas?).
+    # Sub-árvores com junção feitas só de σ, π e ⨝ usam a assinatura do modelo
+    # de custo (tabelas + predicados normalizados): qualquer ordem de junção e
+    # quaisquer projeções intermediárias dão as mesmas linhas, então a entrada
+    # guarda as colunas de todas as tabelas e cada consulta projeta o que usa.
+    # O resto (γ, τ, Limite, tabelas repetidas) usa a impressão digital, que
+    # também é a chave do resultado guardado só com as colunas do nó
+    leaves = _table_leaves(node)
+    if len(leaves) > 1 and len(set(leaves)) == len(leaves):
+        signature = cost_model.node_signature(node)
+        if signature is not None:
+            return hashlib.sha1(f"spj:{signature}".encode('utf-8')).hexdigest(), True
+    return fingerprint(node), False
+
+def _substitute_cached_subtrees(node: Node, cache, cost_model: CostModel) -> Node:
+    # de cima para baixo: a maior sub-árvore já materializada vira um nó Cache
+    # (o filho fica, para recalcular se a entrada sair do cache)
+    if node.node_type not in ('Tabela', 'Cache'):
+        key, all_columns = cache_key(node, cost_model)
+        if key not in cache and all_columns:
+            key = fingerprint(node)
+        if key in cache:
+            return Node("Cache", f"{key[:12]}: {', '.join(sorted(get_tables(node)))}", [node])
+    node.children = [_substitute_cached_subtrees(c, cache, cost_model) for c in node.children]
+    return node
+
 # Plano de Execução (HU5)
+def describe_step(node: Node) -> str:
+    # texto do passo do plano para um nó
+    step = ""
+    if node.node_type == 'Tabela':
+        step = f"Acessar a tabela '{node.value}'."
+    elif node.node_type == 'σ':
+        step = f"Aplicar SELEÇÃO com a condição: {node.value}."
+    elif node.node_type == '⨝':
+        step = f"Realizar JUNÇÃO com a condição: {node.value}."
+    elif node.node_type == 'π':
+        step = f"Projetar os seguintes atributos: {node.value}."
+    elif node.node_type in ('γ', 'γ parcial'):
+        group_keys, aggregates = parse_aggregate_value(node.value)
+        prefix = "Pré-agregar (agregação parcial)" if node.node_type == 'γ parcial' else "Agrupar"
+        if group_keys:
+            step = f"{prefix} por {', '.join(group_keys)} calculando: {', '.join(aggregates)}."
+        else:
+            step = f"Calcular as agregações: {', '.join(aggregates)}."
+    elif node.node_type == 'τ':
+        step = f"Ordenar por: {node.value}."
+    elif node.node_type == 'Limite':
+        step = f"Limitar o resultado às primeiras {node.value} linhas."
+    elif node.node_type == 'Bloom':
+        step = f"Descartar linhas com filtro de Bloom (semi-junção): {node.value}."
+    elif node.node_type == 'Cache':
+        step = f"Reutilizar o resultado materializado em cache: {node.value}."
+    elif node.node_type == 'Top-K':
+        limit, order = node.value.split(';', 1)
+        step = f"Selecionar as {limit.strip()} primeiras linhas por {order.strip()} com heap limitado (Top-K)."
+    return step
+
 def generate_execution_plan(optimized_graph: Node) -> list:
     # lista para armazenar os passos
     plan = []
     
     # define uma função interna recursiva
     def post_order_traversal(node):
-        # vsita os filhos 
-        for child in node.children:
-            post_order_traversal(child)
+        # vsita os filhos (a sub-árvore de um Cache não é recalculada)
+        if node.node_type != 'Cache':
+            for child in node.children:
+                post_order_traversal(child)
             
         # depois que os filhos foram processados, processa o nó atual
-        step = ""
-        if node.node_type == 'Tabela':
-            step = f"Acessar a tabela '{node.value}'."
-        elif node.node_type == 'σ':
-            step = f"Aplicar SELEÇÃO com a condição: {node.value}."
-        elif node.node_type == '⨝':
-            step = f"Realizar JUNÇÃO com a condição: {node.value}."
-        elif node.node_type == 'π':
-            step = f"Projetar os seguintes atributos: {node.value}."
-        
-        # adiciona o passo à lista do plano
-        plan.append(step)
+        # e adiciona o passo à lista do plano
+        plan.append(describe_step(node))
         
     # inicia a travessia a partir da raiz do grafo
     post_order_traversal(optimized_graph)
@@ -0,0 +1,115 @@
+import sys
+import threading
+from collections import OrderedDict
+
+# Cache de Resultados
+# Guarda resultados já calculados (a consulta inteira e as sub-árvores de
+# junção) pela chave da sub-árvore (query_processor.cache_key).
+# Cada entrada é marcada com as tabelas base de que depende: uma escrita numa
+# tabela invalida só as entradas que a usam. A memória é limitada e as
+# entradas menos usadas recentemente saem primeiro (LRU).
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def estimate_size(relation) -> int:
+    # tamanho aproximado em bytes, por amostragem de até 64 linhas
+    rows = relation.rows
+    if not rows:
+        return sys.getsizeof(rows)
+    sample = rows[::max(1, len(rows) // 64)][:64]
+    per_row = sum(sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row) for row in sample) / len(sample)
+    return int(sys.getsizeof(rows) + per_row * len(rows))
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        if max_bytes < 0:
+            raise ValueError("O tamanho máximo do cache não pode ser negativo.")
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        # chave -> (relação, tabelas base, tamanho), da menos para a mais usada
+        self._entries = OrderedDict()
+        # tabela -> chaves das entradas que dependem dela
+        self._by_table = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str):
+        # a relação devolvida é compartilhada: não deve ser alterada
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, relation, tables) -> bool:
+        size = estimate_size(relation)
+        if size > self.max_bytes:
+            # maior que o cache inteiro: não vale expulsar tudo por ele
+            return False
+        tables = frozenset(table.lower() for table in tables)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (relation, tables, size)
+            self.used_bytes += size
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            while self.used_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def invalidate(self, table: str) -> int:
+        # remove as entradas que dependem da tabela; devolve quantas saíram
+        with self._lock:
+            keys = self._by_table.pop(table.lower(), set())
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def dependencies(self) -> dict:
+        # chave -> tabelas base de cada entrada (cópia, para conferir invalidações)
+        with self._lock:
+            return {key: tables for key, (_, tables, _) in self._entries.items()}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self.used_bytes = 0
+
+    def _remove(self, key: str):
+        _, tables, size = self._entries.pop(key)
+        self.used_bytes -= size
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "used_bytes": self.used_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -15,6 +15,41 @@ def load_metadata(filepath: str = "metadados.json"):
         print(f"ERRO CRÍTICO: O arquivo '{filepath}' não é um JSON válido.")
         return None 
 
+AGGREGATE_ITEM = re.compile(r"^(count|sum|avg|min|max)\s*\(\s*(\*|[a-z_][a-z0-9_.]*)\s*\)$")
+
+def _validate_grouping(select_part: str, group_part, order_part) -> bool:
+    select_items = [item.strip() for item in select_part.split(',')]
+    group_keys = {key.strip() for key in group_part.split(',')} if group_part else set()
+    order_items = [re.sub(r"\s+(asc|desc)$", "", item.strip()) for item in order_part.split(',')] if order_part else []
+
+    # agregação no ORDER BY também agrupa a consulta (vira um γ)
+    aggregated = False
+    for item in select_items + order_items:
+        if re.match(r"^(count|sum|avg|min|max)\s*\(", item):
+            match = AGGREGATE_ITEM.match(item)
+            # só count aceita '*'
+            if not match or (match.group(2) == '*' and match.group(1) != 'count'):
+                print(f">>> ERRO: Agregação '{item}' inválida.")
+                return False
+            aggregated = True
+
+    if not group_keys and not aggregated:
+        return True
+
+    # com agregação, todo atributo comum do SELECT/ORDER BY tem que estar no GROUP BY
+    for item in select_items + order_items:
+        if item == '*':
+            print(">>> ERRO: SELECT * não pode ser usado com GROUP BY ou agregações.")
+            return False
+        if AGGREGATE_ITEM.match(item):
+            continue
+        # aceita "cliente.nome" no SELECT com "nome" no GROUP BY (e vice-versa)
+        if item not in group_keys and item.split('.')[-1] not in {key.split('.')[-1] for key in group_keys}:
+            print(f">>> ERRO: O atributo '{item}' precisa estar no GROUP BY ou dentro de uma agregação.")
+            return False
+    print(">>> Agrupamento validado com sucesso.")
+    return True
+
 # HU1 - Entrada e Validação da Consulta
 def validate_sql(query: str, metadata: dict) -> bool:
     if metadata is None:
@@ -39,6 +74,19 @@ def validate_sql(query: str, metadata: dict) -> bool:
         
     # pega o texto inteiro que foi "match"
     full_query_str = match.group(0)
+
+    # Requisito: GROUP BY, ORDER BY e LIMIT (opcionais, no fim e nessa ordem)
+    # procura as cláusulas sem o conteúdo dos literais (ex: nome = 'order by x')
+    query_without_literal_text = re.sub(r"\'(.*?)\'", "''", normalized_query)
+    clauses = re.match(r"(select\s+(.+?)\s+from\s+(.+?))(?:\s+group\s+by\s+(.+?))?(?:\s+order\s+by\s+(.+?))?(?:\s+limit\s+(\S+))?$", query_without_literal_text)
+    main_query, select_part, _, group_part, order_part, limit_part = clauses.groups()
+    # se sobrou alguma dessas palavras no meio, as cláusulas estão fora de ordem
+    if re.search(r"\b(group\s+by|order\s+by|limit)\b", main_query) or (group_part and re.search(r"\b(order\s+by|limit)\b", group_part)):
+        print(">>> ERRO: As cláusulas GROUP BY, ORDER BY e LIMIT devem vir no fim da consulta, nessa ordem.")
+        return False
+    if limit_part is not None and not limit_part.isdigit():
+        print(f">>> ERRO: O LIMIT deve ser um número inteiro, não '{limit_part}'.")
+        return False
     
     # validação de JOIN/ON
     if 'join' in normalized_query and 'on' not in normalized_query:
@@ -74,7 +122,8 @@ def validate_sql(query: str, metadata: dict) -> bool:
     all_available_attributes = {attr for attributes in valid_tables.values() for attr in attributes}
     
     # palavras chave do sql permitidas
-    allowed_keywords = {"select", "from", "where", "join", "on", "and", "or"}
+    allowed_keywords = {"select", "from", "where", "join", "on", "and", "or",
+                        "group", "order", "by", "asc", "desc", "limit", "count", "sum", "avg", "min", "max"}
     
     # pega todas as palavras que parecem ser atributos na query sem literais
     attributes_to_check = re.findall(r'\b[a-z_][a-z0-9_.]+\b', query_without_literals)
@@ -92,10 +141,14 @@ def validate_sql(query: str, metadata: dict) -> bool:
                 return False
     print(">>> Atributos validados com sucesso.")
 
+    # Requisito: Validar agregações e GROUP BY
+    if not _validate_grouping(select_part, group_part, order_part):
+        return False
+
     # Requisito: Validar Operadores (=, >, <, <=, >=, <>, AND, ( ))
     
-    # pega a parte da query depois do 'from' 
-    from_where_part = match.group(2)
+    # pega a parte da query depois do 'from' (sem GROUP BY, ORDER BY e LIMIT)
+    from_where_part = clauses.group(3)
     
     # pega só o texto que vem depois de 'where' ou 'on'.
     conditions_part = ' '.join(re.findall(r'(?:where|on)\s+(.*?)(?:\s+join|\s+on|\s*$)', from_where_part))